@@ -1,3 +1,59 @@
 class Config:
     SQLALCHEMY_DATABASE_URI = 'mysql+mysqlconnector://root:@localhost/steam_games'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool of every server process; gunicorn workers each open their own
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_recycle': 1800,  # well below MariaDB's wait_timeout
+        'pool_pre_ping': True,
+    }
+
+    # 'database' answers from MariaDB; 'memory' loads the chunk_<n>.json files of
+    # DATA_CHUNK_DIR into an in-process column store at startup and answers every
+    # read endpoint from it, without a database
+    DATA_SOURCE = 'database'
+    DATA_CHUNK_DIR = 'd3-ts-website/src/data'
+    # Memory mode maps this binary snapshot of the store instead when it is up to date
+    # with the chunks (written by `python -m data_server.snapshot` or the merge script)
+    DATA_SNAPSHOT_PATH = 'steam_games.snapshot'
+    # How often the gunicorn master looks for a new snapshot to reload the workers with (0 never)
+    DATA_RELOAD_CHECK_SECONDS = 30
+
+    # Rendered list responses are cached per dataset version up to this many bytes
+    RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    # Cached bodies at least this large are stored precompressed as gzip and brotli
+    RESPONSE_CACHE_MIN_COMPRESS_BYTES = 1024
+    RESPONSE_CACHE_GZIP_LEVEL = 9
+    RESPONSE_CACHE_BROTLI_QUALITY = 9
+    # Serialized game details kept for the most recently opened games
+    GAME_DETAILS_CACHE_SIZE = 2048
+    GAME_DETAILS_CACHE_TTL = 600
+    # How long the dataset version written by the loader is trusted before re-reading it
+    DATASET_VERSION_CHECK_SECONDS = 5
+    # Bearer token POST /api/cache/invalidate requires; the endpoint is disabled while empty
+    CACHE_INVALIDATE_TOKEN = ''
+
+    # Steam store API used for review histograms; point it at a local stub for testing
+    STEAM_STORE_BASE_URL = 'https://store.steampowered.com'
+    UPSTREAM_CONNECT_TIMEOUT = 3.05
+    UPSTREAM_READ_TIMEOUT = 10
+    UPSTREAM_POOL_SIZE = 10
+    # Threads refreshing stale histograms in the background
+    UPSTREAM_REFRESH_WORKERS = 2
+    # Histograms are fresh for CACHE_TTL seconds, then served stale for up to
+    # STALE_TTL more while they are refreshed in the background (0 disables that)
+    RECOMMENDATIONS_CACHE_SIZE = 4096
+    RECOMMENDATIONS_CACHE_TTL = 3600
+    RECOMMENDATIONS_STALE_TTL = 86400
+
+    # Review histograms are stored locally; older than MAX_AGE they are refetched in the
+    # background, and the top PREFETCH_TOP_N games by peak_ccu are kept fresh ahead of time
+    REVIEW_HISTOGRAM_MAX_AGE = 24 * 3600
+    REVIEW_PREFETCH_ENABLED = True
+    REVIEW_PREFETCH_TOP_N = 500
+    REVIEW_PREFETCH_INTERVAL = 3600
+    # Upper bound on Steam requests per second made by the prefetcher; 0 disables it
+    REVIEW_PREFETCH_RATE = 1.0
+    # Under gunicorn only the worker holding this lock file prefetches the top-N games
+    REVIEW_PREFETCH_LOCK_FILE = 'review_prefetch.lock'
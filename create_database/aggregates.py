@@ -0,0 +1,46 @@
+"""
+Derived tables rebuilt from the loaded games after every load.
+"""
+from sqlalchemy import case, delete, func, insert, literal, literal_column, select
+
+from models import Category, FacetAggregate, Game, Genre, game_category, game_genre
+from transform import PRICE_BANDS
+
+# (facet name, dimension model, association table, association column)
+FACETS = (
+    ('genre', Genre, game_genre, 'genre_id'),
+    ('category', Category, game_category, 'category_id'),
+)
+
+FACET_AGGREGATE_COLUMNS = (
+    'facet', 'name', 'release_year', 'owners_low', 'owners_high', 'price_band',
+    'game_count', 'peak_ccu_count', 'peak_ccu_sum',
+)
+
+
+def price_band_expression():
+    """transform.price_band in SQL, with the edges inlined so it can be grouped by"""
+    edges = [literal_column(repr(edge)) for edge in reversed(PRICE_BANDS)]
+    return case(
+        *((Game.price >= edge, edge) for edge in edges[:-1]),
+        (Game.price.is_not(None), edges[-1]),
+    )
+
+
+def refresh_facet_aggregates(connection):
+    """Rebuild facet_aggregates with one INSERT ... SELECT ... GROUP BY per facet"""
+    table = FacetAggregate.__table__
+    connection.execute(delete(table))
+    for facet, model, association, column in FACETS:
+        cell = (model.name, Game.release_year, Game.owners_low, Game.owners_high, price_band_expression())
+        query = (
+            select(
+                literal(facet), *cell,
+                func.count(), func.count(Game.peak_ccu), func.coalesce(func.sum(Game.peak_ccu), 0),
+            )
+            .select_from(association)
+            .join(Game, Game.id == association.c.game_id)
+            .join(model, model.id == association.c[column])
+            .group_by(*cell)
+        )
+        connection.execute(insert(table).from_select(FACET_AGGREGATE_COLUMNS, query))
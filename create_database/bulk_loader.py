@@ -0,0 +1,248 @@
+import json
+import time
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from models import (
+    Game, Package, Developer, Publisher, Category, Genre, Tag,
+    game_developer, game_publisher, game_category, game_genre, game_tag,
+)
+from transform import game_columns, name_key, package_columns, tag_votes, unique
+
+BATCH_SIZE = 1000
+
+# (games.json key, dimension model, association table, association column)
+DIMENSIONS = (
+    ('developers', Developer, game_developer, 'developer_id'),
+    ('publishers', Publisher, game_publisher, 'publisher_id'),
+    ('categories', Category, game_category, 'category_id'),
+    ('genres', Genre, game_genre, 'genre_id'),
+    ('tags', Tag, game_tag, 'tag_id'),
+)
+
+
+def dimension_links(game_data, key):
+    """(name, extra association columns) for each dimension value of a game"""
+    if key == 'tags':
+        return [(name, {'votes': votes}) for name, votes in tag_votes(game_data)]
+    return [(name, {}) for name in unique(game_data.get(key, []))]
+
+
+def prepare_game(game_id, game_data):
+    """
+    Build the rows of one game without touching the database.
+
+    Ids are left out on purpose: they are assigned by the single BulkLoader
+    that writes the rows, which keeps them deterministic when the rows are
+    prepared in worker processes.
+    """
+    return (
+        game_columns(game_id, game_data),
+        [package_columns(pkg) for pkg in game_data.get('packages', [])],
+        [dimension_links(game_data, key) for key, _, _, _ in DIMENSIONS],
+    )
+
+
+def prepare_piece(text):
+    """Process pool entry point: decode and prepare the games of a JSON object holding part of the dump"""
+    return [prepare_game(game_id, game_data) for game_id, game_data in json.loads(text).items()]
+
+
+class BulkLoader:
+    """
+    Batched Core-level loader for the games schema.
+
+    Dimension names are resolved through name -> id dictionaries preloaded from
+    the database, and primary keys are assigned here rather than by the server,
+    so association rows can be written with plain executemany inserts without
+    reading anything back. Every `batch_size` games the pending rows are
+    flushed and committed.
+
+    Because ids continue from the `max(id)` read at construction, the load
+    needs exclusive write access to the games schema: run it while the API is
+    read-only and no other loader is running, or ids will collide.
+    """
+
+    def __init__(self, connection, batch_size=BATCH_SIZE):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.started_at = time.perf_counter()
+
+        self.dimension_ids = {}
+        self.next_ids = {}
+        for key, model, _, _ in DIMENSIONS:
+            self.dimension_ids[key] = {
+                name_key(name): dimension_id
+                for name, dimension_id in connection.execute(select(model.name, model.id))
+            }
+            self.next_ids[key] = self._max_id(model) + 1
+        self.next_ids['games'] = self._max_id(Game) + 1
+        self.next_ids['packages'] = self._max_id(Package) + 1
+
+        self._reset_pending()
+
+    def _max_id(self, model):
+        return self.connection.execute(select(func.max(model.id))).scalar() or 0
+
+    def _reset_pending(self):
+        self.pending_games = []
+        self.pending_packages = []
+        self.pending_dimensions = {key: [] for key, _, _, _ in DIMENSIONS}
+        self.pending_links = {key: [] for key, _, _, _ in DIMENSIONS}
+
+    def _take_id(self, key):
+        next_id = self.next_ids[key]
+        self.next_ids[key] += 1
+        return next_id
+
+    def resolve(self, key, name):
+        """Return the id for a dimension name, queueing a new row on first sight"""
+        ids = self.dimension_ids[key]
+        folded = name_key(name)
+        dimension_id = ids.get(folded)
+        if dimension_id is None:
+            dimension_id = ids[folded] = self._take_id(key)
+            self.pending_dimensions[key].append({'id': dimension_id, 'name': name})
+        return dimension_id
+
+    def add(self, game_id, game_data):
+        self.add_prepared(prepare_game(game_id, game_data))
+
+    def add_prepared(self, prepared):
+        columns, packages, links = prepared
+        game_pk = self._take_id('games')
+        self.pending_games.append({'id': game_pk, **columns})
+        self._queue_children(game_pk, packages, links)
+
+        if len(self.pending_games) >= self.batch_size:
+            self.flush()
+
+    def _queue_children(self, game_pk, packages, links):
+        for package in packages:
+            self.pending_packages.append({'id': self._take_id('packages'), 'game_id': game_pk, **package})
+
+        for (key, _, _, column), key_links in zip(DIMENSIONS, links):
+            # Spellings that differ only in case map to one row; link it once
+            linked = set()
+            for name, extra in key_links:
+                dimension_id = self.resolve(key, name)
+                if dimension_id not in linked:
+                    linked.add(dimension_id)
+                    self.pending_links[key].append({'game_id': game_pk, column: dimension_id, **extra})
+
+    def _insert(self, table, rows):
+        if rows:
+            self.connection.execute(insert(table), rows)
+            self.rows_written += len(rows)
+
+    def _write_games(self):
+        self._insert(Game.__table__, self.pending_games)
+
+    def flush(self):
+        # Parents first so the foreign keys of the association rows resolve
+        for key, model, _, _ in DIMENSIONS:
+            self._insert(model.__table__, self.pending_dimensions[key])
+        self._write_games()
+        self._insert(Package.__table__, self.pending_packages)
+        for key, _, table, _ in DIMENSIONS:
+            self._insert(table, self.pending_links[key])
+
+        self.connection.commit()
+        self._reset_pending()
+
+    def finish(self):
+        self.flush()
+
+    @property
+    def changed(self):
+        return self.rows_written > 0
+
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started_at
+        return self.rows_written / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started_at
+        print(f"Inserted {self.rows_written} rows in {elapsed:.1f}s ({self.rows_per_second():.0f} rows/s)")
+
+
+class IncrementalLoader(BulkLoader):
+    """
+    Delta loader keyed on games.game_id.
+
+    Games whose content hash matches the stored one are skipped. Changed games
+    keep their primary key: the row is updated in place and its packages and
+    association rows are replaced. Games missing from the dump are deleted by
+    `finish`.
+    """
+
+    def __init__(self, connection, batch_size=BATCH_SIZE):
+        super().__init__(connection, batch_size)
+        self.existing = {
+            game_id: (game_pk, stored_hash)
+            for game_id, game_pk, stored_hash in connection.execute(
+                select(Game.game_id, Game.id, Game.content_hash)
+            )
+        }
+        self.seen = set()
+        self.counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+
+    def _reset_pending(self):
+        super()._reset_pending()
+        self.pending_updates = []
+
+    def add_prepared(self, prepared):
+        columns, packages, links = prepared
+        game_id = columns['game_id']
+        self.seen.add(game_id)
+
+        existing = self.existing.get(game_id)
+        if existing is None:
+            self.counts['inserted'] += 1
+            super().add_prepared(prepared)
+            return
+
+        game_pk, stored_hash = existing
+        if stored_hash == columns['content_hash']:
+            self.counts['unchanged'] += 1
+            return
+
+        self.counts['updated'] += 1
+        self.pending_updates.append({'_id': game_pk, **columns})
+        self._queue_children(game_pk, packages, links)
+
+        if len(self.pending_games) + len(self.pending_updates) >= self.batch_size:
+            self.flush()
+
+    def _delete_children(self, game_pks):
+        self.connection.execute(delete(Package.__table__).where(Package.game_id.in_(game_pks)))
+        for _, _, table, _ in DIMENSIONS:
+            self.connection.execute(delete(table).where(table.c.game_id.in_(game_pks)))
+
+    def _write_games(self):
+        super()._write_games()
+        if self.pending_updates:
+            self._delete_children([row['_id'] for row in self.pending_updates])
+            games = Game.__table__
+            self.connection.execute(update(games).where(games.c.id == bindparam('_id')), self.pending_updates)
+            self.rows_written += len(self.pending_updates)
+
+    def finish(self):
+        """Flush what is pending and delete the games that are no longer in the dump"""
+        self.flush()
+        stale = [game_pk for game_id, (game_pk, _) in self.existing.items() if game_id not in self.seen]
+        for start in range(0, len(stale), self.batch_size):
+            game_pks = stale[start:start + self.batch_size]
+            self._delete_children(game_pks)
+            self.connection.execute(delete(Game.__table__).where(Game.id.in_(game_pks)))
+            self.connection.commit()
+        self.counts['deleted'] = len(stale)
+
+    @property
+    def changed(self):
+        return self.rows_written > 0 or self.counts['deleted'] > 0
+
+    def report(self):
+        super().report()
+        print(", ".join(f"{name}: {count}" for name, count in self.counts.items()))
@@ -0,0 +1,86 @@
+"""
+EXPLAIN the queries behind the hot API endpoints and fail on full table scans.
+
+Run it against a loaded database; on near-empty tables the optimizer may
+legitimately prefer a scan.
+
+    python create_database/check_query_plans.py
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import and_, create_engine, or_, select
+
+from models import Game, Category, Genre, Tag, game_category, game_genre, game_tag
+
+HOT_QUERIES = {
+    'top games by peak_ccu': (
+        select(Game.game_id, Game.peak_ccu).order_by(Game.peak_ccu.desc()).limit(100)
+    ),
+    'scatter page after a peak_ccu cursor': (
+        select(Game.game_id, Game.peak_ccu, Game.id)
+        .where(or_(Game.peak_ccu < 500, and_(Game.peak_ccu == 500, Game.id < 1000)))
+        .order_by(Game.peak_ccu.desc(), Game.id.desc()).limit(1000)
+    ),
+    'cheapest games': (
+        select(Game.game_id, Game.price).order_by(Game.price).limit(100)
+    ),
+    'games released in a month': (
+        select(Game.game_id).where(Game.release_date >= datetime(2020, 1, 1), Game.release_date < datetime(2020, 2, 1))
+    ),
+    'games by release year': (
+        select(Game.game_id).where(Game.release_year == 2008)
+    ),
+    'games by owners bucket': (
+        select(Game.game_id).where(Game.owners_low == 50000000)
+    ),
+    'games in a peak_ccu range': (
+        select(Game.game_id).where(Game.peak_ccu.between(100000, 200000))
+    ),
+    'game details by game_id': (
+        select(Game).where(Game.game_id == '730')
+    ),
+    'tags of a game': (
+        select(Tag.name).join(game_tag, game_tag.c.tag_id == Tag.id).where(game_tag.c.game_id == 1)
+    ),
+    'games with a tag': (
+        select(game_tag.c.game_id).join(Tag, game_tag.c.tag_id == Tag.id).where(Tag.name == 'Indie')
+    ),
+    'games with a genre': (
+        select(game_genre.c.game_id).join(Genre, game_genre.c.genre_id == Genre.id).where(Genre.name == 'Action')
+    ),
+    'games with a category': (
+        select(game_category.c.game_id).join(Category, game_category.c.category_id == Category.id)
+        .where(Category.name == 'Multi-player')
+    ),
+}
+
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    result = connection.exec_driver_sql(f"EXPLAIN {compiled}")
+    return [dict(row._mapping) for row in result]
+
+
+def check_query_plans(engine):
+    """Print the plan of every hot query and return the names of those doing a full scan"""
+    failures = []
+    with engine.connect() as connection:
+        for name, statement in HOT_QUERIES.items():
+            plan = explain(connection, statement)
+            full_scans = [step['table'] for step in plan if step['type'] == 'ALL']
+            print(f"[{'FAIL' if full_scans else 'OK'}] {name}")
+            for step in plan:
+                print(f"    {step['table']}: type={step['type']} key={step['key']} rows={step['rows']}")
+            if full_scans:
+                failures.append(name)
+    return failures
+
+
+if __name__ == "__main__":
+    from create_database import DATABASE_URL
+
+    failed = check_query_plans(create_engine(DATABASE_URL))
+    if failed:
+        print(f"\nFull table scans in: {', '.join(failed)}")
+        sys.exit(1)
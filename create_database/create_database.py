@@ -1,126 +1,188 @@
-import json
+import argparse
+import os
+import uuid
+from collections import deque
 from datetime import datetime
-from sqlalchemy import create_engine
+from multiprocessing import Pool
+from sqlalchemy import bindparam, create_engine, delete, insert, update
 from sqlalchemy.orm import sessionmaker
 from tqdm import tqdm
 
-from models import Base, Game, Package, Developer, Publisher, Category, Genre, Tag
+from aggregates import refresh_facet_aggregates
+from bulk_loader import BATCH_SIZE, BulkLoader, IncrementalLoader, prepare_piece
+from json_stream import iter_json_object, iter_json_pieces
+from migrate import upgrade
+from similarity import refresh_similar_games
+from models import DatasetMeta, Game, Package, Developer, Publisher, Category, Genre, Tag, game_tag
+from transform import game_columns, package_columns, tag_votes, unique
 
 DATABASE_URL = 'mysql+mysqlconnector://root:@localhost/steam_games'
+GAMES_JSON = 'create_database/games.json'
 
 
-def parse_date(date_str):
-    try:
-        return datetime.strptime(date_str, "%b %d, %Y")
-    except ValueError:
-        try:
-            date_str_with_day = f"1 {date_str}"
-            return datetime.strptime(date_str_with_day, "%d %b %Y")
-        except ValueError:
-            return None
+def progress_bar(path):
+    return tqdm(total=os.path.getsize(path), unit='B', unit_scale=True, unit_divisor=1024)
 
 
-def load_data(json_data):
+def iter_games(path):
+    """Stream (game_id, game_data) pairs from games.json with a byte-based progress bar"""
+    with open(path, 'rb') as file, progress_bar(path) as progress:
+        yield from iter_json_object(file, on_bytes=progress.update)
+
+
+def iter_game_pieces(path, size):
+    """Split games.json into JSON objects of `size` games each, undecoded, with a byte-based progress bar"""
+    with open(path, 'rb') as file, progress_bar(path) as progress:
+        yield from iter_json_pieces(file, size, on_bytes=progress.update)
+
+
+def bump_dataset_version(engine):
+    """
+    Rebuild the derived tables and record a new dataset version in one
+    transaction; the API drops its cached responses when the version changes.
+    """
+    table = DatasetMeta.__table__
+    with engine.begin() as connection:
+        refresh_facet_aggregates(connection)
+        refresh_similar_games(connection)
+        connection.execute(delete(table).where(table.c.key == 'version'))
+        connection.execute(insert(table).values(key='version', value=uuid.uuid4().hex, updated_at=datetime.now()))
+
+
+def load_data(games):
     engine = create_engine(DATABASE_URL)
-    Base.metadata.create_all(engine)
+    upgrade(engine)
     Session = sessionmaker(bind=engine)
     session = Session()
+    tag_links = []
 
-    for game_id, game_data in tqdm(json_data.items()):
-        game = Game(
-            game_id=game_id,
-            name=game_data.get('name', ''),
-            release_date=parse_date(game_data.get('release_date', '')),
-            required_age=game_data.get('required_age', 0),
-            price=game_data.get('price', 0.0),
-            dlc_count=game_data.get('dlc_count', 0),
-            detailed_description=game_data.get('detailed_description', ''),
-            about_the_game=game_data.get('about_the_game', ''),
-            short_description=game_data.get('short_description', ''),
-            reviews=game_data.get('reviews', ''),
-            header_image=game_data.get('header_image', ''),
-            website=game_data.get('website', ''),
-            support_url=game_data.get('support_url', ''),
-            support_email=game_data.get('support_email', ''),
-            windows=game_data.get('windows', False),
-            mac=game_data.get('mac', False),
-            linux=game_data.get('linux', False),
-            metacritic_score=game_data.get('metacritic_score', 0),
-            metacritic_url=game_data.get('metacritic_url', ''),
-            achievements=game_data.get('achievements', 0),
-            recommendations=game_data.get('recommendations', 0),
-            notes=game_data.get('notes', ''),
-            supported_languages=game_data.get('supported_languages', []),
-            full_audio_languages=game_data.get('full_audio_languages', []),
-            screenshots=game_data.get('screenshots', []),
-            movies=game_data.get('movies', []),
-            user_score=game_data.get('user_score', 0.0),
-            score_rank=game_data.get('score_rank', ''),
-            positive=game_data.get('positive', 0),
-            negative=game_data.get('negative', 0),
-            estimated_owners=game_data.get('estimated_owners', ''),
-            average_playtime_forever=game_data.get('average_playtime_forever', 0),
-            average_playtime_2weeks=game_data.get('average_playtime_2weeks', 0),
-            median_playtime_forever=game_data.get('median_playtime_forever', 0),
-            median_playtime_2weeks=game_data.get('median_playtime_2weeks', 0),
-            peak_ccu=game_data.get('peak_ccu', 0),
-        )
+    for game_id, game_data in games:
+        game = Game(**game_columns(game_id, game_data))
 
         for pkg in game_data.get('packages', []):
-            package = Package(
-                title=pkg.get('title', ''),
-                description=pkg.get('description', ''),
-                subs=pkg.get('subs', []),
-            )
+            package = Package(**package_columns(pkg))
             game.packages.append(package)
 
         session.add(game)
 
-        for dev_name in game_data.get('developers', []):
+        for dev_name in unique(game_data.get('developers', [])):
             developer = session.query(Developer).filter_by(name=dev_name).first()
             if not developer:
                 developer = Developer(name=dev_name)
             game.developers.append(developer)
 
-        for pub_name in game_data.get('publishers', []):
+        for pub_name in unique(game_data.get('publishers', [])):
             publisher = session.query(Publisher).filter_by(name=pub_name).first()
             if not publisher:
                 publisher = Publisher(name=pub_name)
             game.publishers.append(publisher)
 
-        for cat_name in game_data.get('categories', []):
+        for cat_name in unique(game_data.get('categories', [])):
             category = session.query(Category).filter_by(name=cat_name).first()
             if not category:
                 category = Category(name=cat_name)
             game.categories.append(category)
 
-        for genre_name in game_data.get('genres', []):
+        for genre_name in unique(game_data.get('genres', [])):
             genre = session.query(Genre).filter_by(name=genre_name).first()
             if not genre:
                 genre = Genre(name=genre_name)
             game.genres.append(genre)
 
-        tags = game_data.get('tags', {})
-        if isinstance(tags, dict):
-            for tag_name, tag_count in tags.items():
-                tag = session.query(Tag).filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                game.tags.append(tag)
-        elif isinstance(tags, list):
-            for tag_name in tags:
-                tag = session.query(Tag).filter_by(name=tag_name).first()
-                if not tag:
-                    tag = Tag(name=tag_name)
-                game.tags.append(tag)
+        for tag_name, votes in tag_votes(game_data):
+            tag = session.query(Tag).filter_by(name=tag_name).first()
+            if not tag:
+                tag = Tag(name=tag_name)
+            game.tags.append(tag)
+            if votes is not None:
+                tag_links.append((game, tag, votes))
 
         session.add(game)
 
+    # The tags relationship only writes the key columns of game_tag
+    session.flush()
+    if tag_links:
+        session.execute(
+            update(game_tag).where(
+                game_tag.c.game_id == bindparam('_game_id'), game_tag.c.tag_id == bindparam('_tag_id'),
+            ),
+            [{'_game_id': game.id, '_tag_id': tag.id, 'votes': votes} for game, tag, votes in tag_links],
+        )
     session.commit()
     session.close()
+    bump_dataset_version(engine)
+
+
+def bulk_load_data(games, batch_size=BATCH_SIZE, incremental=False):
+    engine = create_engine(DATABASE_URL)
+    upgrade(engine)
+
+    with engine.connect() as connection:
+        loader = (IncrementalLoader if incremental else BulkLoader)(connection, batch_size)
+        for game_id, game_data in games:
+            loader.add(game_id, game_data)
+        loader.finish()
+        loader.report()
+
+    if loader.changed:
+        bump_dataset_version(engine)
+
+
+def parallel_load_data(pieces, batch_size=BATCH_SIZE, workers=os.cpu_count(), incremental=False):
+    """
+    Bulk load with JSON decoding and row construction spread over a process pool.
+
+    `pieces` yields the undecoded JSON text of consecutive parts of the dump,
+    each an object of up to `batch_size` games, which workers decode and turn
+    into rows. This process stays the only writer: results are consumed in
+    submission order and ids are assigned as they arrive, so the database
+    ends up identical to a serial --bulk load. At most two pieces per worker
+    are in flight to keep memory bounded.
+    """
+    engine = create_engine(DATABASE_URL)
+    upgrade(engine)
+
+    with engine.connect() as connection, Pool(workers) as pool:
+        loader = (IncrementalLoader if incremental else BulkLoader)(connection, batch_size)
+        in_flight = deque()
+
+        def write_oldest():
+            for prepared in in_flight.popleft().get():
+                loader.add_prepared(prepared)
+
+        for piece in pieces:
+            in_flight.append(pool.apply_async(prepare_piece, (piece,)))
+            if len(in_flight) >= workers * 2:
+                write_oldest()
+        while in_flight:
+            write_oldest()
+
+        loader.finish()
+        loader.report()
+
+    if loader.changed:
+        bump_dataset_version(engine)
 
 
 if __name__ == "__main__":
-    with open('create_database/games.json', 'r', encoding='utf-8') as file:
-        data = json.load(file)
-        load_data(data)
+    parser = argparse.ArgumentParser(description="Load games.json into the steam_games database")
+    parser.add_argument('--input', default=GAMES_JSON, help="Path of the games.json dump to load")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Use the batched loader with in-memory dimension caches")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="Games per insert batch and commit in --bulk mode")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Build rows in N worker processes (implies --bulk)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Upsert against the existing database by content hash instead of loading "
+                             "into an empty one; games missing from the dump are deleted (implies --bulk)")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        parallel_load_data(
+            iter_game_pieces(args.input, args.batch_size), args.batch_size, args.workers, args.incremental,
+        )
+    elif args.bulk or args.incremental:
+        bulk_load_data(iter_games(args.input), args.batch_size, args.incremental)
+    else:
+        load_data(iter_games(args.input))
@@ -0,0 +1,244 @@
+import codecs
+import json
+import re
+
+import numpy as np
+
+CHUNK_SIZE = 1 << 20
+# A single value may not grow the buffer past this many characters: a
+# truncated or corrupt file fails here instead of being read into memory
+MAX_VALUE_SIZE = 64 << 20
+# A value cut short by the window edge decodes, or fails to, within this many
+# characters of the edge (a number such as "-1.5e", a \uXXXX escape)
+LOOKAHEAD = 16
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+# Depth change of a byte outside strings
+_DEPTH = np.zeros(256, dtype=np.int8)
+_DEPTH[[ord('{'), ord('[')]] = 1
+_DEPTH[[ord('}'), ord(']')]] = -1
+
+
+class JsonObjectStream:
+    """
+    Incremental reader for a file holding one large JSON object.
+
+    Only the current top-level value and a read-ahead window are kept in
+    memory, so the peak footprint is bounded by the largest single game rather
+    than by the file. `on_bytes` is called with the number of raw bytes read,
+    which lets a caller drive a byte-based progress bar. A value longer than
+    `max_value_size` characters raises ValueError.
+    """
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE, on_bytes=None, max_value_size=MAX_VALUE_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.on_bytes = on_bytes
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self, size):
+        raw = self.file.read(size)
+        if self.on_bytes and raw:
+            self.on_bytes(len(raw))
+        if not raw:
+            self.eof = True
+        self.buffer += self.decoder.decode(raw, final=self.eof)
+
+    def _fill(self):
+        if self.pos >= self.chunk_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        # Grow geometrically so a value larger than the window is re-parsed
+        # O(log n) times instead of once per chunk.
+        self._read(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def _grow(self):
+        """_fill for a value that does not fit in the buffer yet"""
+        if len(self.buffer) - self.pos > self.max_value_size:
+            raise ValueError(
+                f"JSON value longer than {self.max_value_size} characters, the file is truncated or corrupt"
+            )
+        self._fill()
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return
+            self._fill()
+
+    def _expect(self, chars):
+        self._skip_whitespace()
+        if self.pos >= len(self.buffer):
+            raise ValueError(f"Unexpected end of JSON, expected one of {chars!r}")
+        char = self.buffer[self.pos]
+        if char not in chars:
+            raise ValueError(f"Unexpected {char!r} in JSON stream, expected one of {chars!r}")
+        self.pos += 1
+        return char
+
+    def _value(self):
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                # An error away from the window edge is in the data itself
+                cut_short = error.msg.startswith('Unterminated string') or error.pos >= len(self.buffer) - LOOKAHEAD
+                if self.eof or not cut_short:
+                    raise
+                self._grow()
+                continue
+            # A number that ends near the window edge may be cut short
+            if end > len(self.buffer) - LOOKAHEAD and not self.eof:
+                self._grow()
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self):
+        self._expect('{')
+        self._skip_whitespace()
+        if self.buffer.startswith('}', self.pos):
+            self.pos += 1
+            return
+
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise ValueError(f"Expected a string key in JSON stream, got {key!r}")
+            self._expect(':')
+            yield key, self._value()
+            if self._expect(',}') == '}':
+                return
+
+
+class JsonObjectSplitter:
+    """
+    Splits a file holding one large JSON object into smaller JSON objects of
+    `members` consecutive members each, without decoding anything, so worker
+    processes can json.loads the pieces themselves.
+
+    Each chunk read is classified by a few vectorised NumPy passes, like the
+    first stage of SIMD JSON parsers: quotes not escaped by an odd run of
+    backslashes toggle the inside-string state, the brackets outside strings
+    give the nesting depth, and the commas at depth 1 separate the members.
+    No Python code runs per member, so this process stays far ahead of the
+    workers. The content itself is only checked when a piece is decoded.
+    """
+
+    def __init__(self, file, members, chunk_size=CHUNK_SIZE, on_bytes=None, max_value_size=MAX_VALUE_SIZE):
+        self.file = file
+        self.members = members
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.on_bytes = on_bytes
+        self.in_string = False
+        self.backslashes = 0  # length of the backslash run ending the previous chunk
+        self.depth = 0
+        self.value_size = 0  # bytes read since the last separator
+
+    def _read(self):
+        chunk = self.file.read(self.chunk_size)
+        if self.on_bytes and chunk:
+            self.on_bytes(len(chunk))
+        return chunk
+
+    def _real_quotes(self, data):
+        """Offsets of the quotes of `data` that are not escaped"""
+        quotes = np.flatnonzero(data == ord('"'))
+        backslashes = np.flatnonzero(data == ord('\\'))
+        # Members of one backslash run share the same offset minus rank
+        runs = backslashes - np.arange(len(backslashes))
+
+        def run_length(ends):
+            ranks = np.searchsorted(backslashes, ends)
+            lengths = ranks - np.searchsorted(runs, runs[ranks]) + 1
+            # A run starting the chunk continues the one ending the previous chunk
+            return lengths + np.where(runs[ranks] == 0, self.backslashes, 0)
+
+        after_backslash = data[np.maximum(quotes - 1, 0)] == ord('\\')
+        after_backslash[quotes == 0] = False
+        escaped = np.zeros(len(quotes), dtype=bool)
+        escaped[after_backslash] = run_length(quotes[after_backslash] - 1) % 2 == 1
+        if len(quotes) and quotes[0] == 0:
+            escaped[0] = self.backslashes % 2 == 1
+
+        if len(data) and data[-1] == ord('\\'):
+            self.backslashes = int(run_length(np.array([len(data) - 1]))[0])
+        else:
+            self.backslashes = 0
+        return quotes[~escaped]
+
+    def _separators(self, chunk):
+        """Offsets in `chunk` of the commas between members and of the brace closing the object"""
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        quotes = self._real_quotes(data)
+        marks = np.flatnonzero(
+            (data == ord(',')) | (data == ord('{')) | (data == ord('}')) | (data == ord('[')) | (data == ord(']'))
+        )
+        marks = marks[(np.searchsorted(quotes, marks) + self.in_string) % 2 == 0]
+        deltas = _DEPTH[data[marks]]
+        depths = self.depth + np.cumsum(deltas, dtype=np.int64)
+
+        self.in_string = (self.in_string + len(quotes)) % 2 == 1
+        if len(depths):
+            if depths.min() < 0:
+                raise ValueError("Unbalanced brackets in JSON stream")
+            self.depth = int(depths[-1])
+        separators = marks[(deltas == 0) & (depths == 1) | (deltas == -1) & (depths == 0)]
+
+        self.value_size = len(data) - 1 - separators[-1] if len(separators) else self.value_size + len(data)
+        if self.value_size > self.max_value_size:
+            raise ValueError(f"JSON value longer than {self.max_value_size} bytes, the file is truncated or corrupt")
+        return separators
+
+    def __iter__(self):
+        chunk = b''
+        while not chunk:
+            chunk = self._read()
+            if not chunk:
+                raise ValueError("Expected a JSON object")
+            chunk = chunk.lstrip(b' \t\n\r')
+        if not chunk.startswith(b'{'):
+            raise ValueError("Expected a JSON object")
+        chunk = chunk[1:] or self._read()
+        self.depth = 1
+
+        piece = []  # the members read since the last piece, as chunk slices
+        count = 0  # separators in `piece`
+        while chunk:
+            separators = self._separators(chunk)
+            start = 0
+            for end in separators[self.members - count - 1::self.members].tolist():
+                piece.append(chunk[start:end])
+                yield b'{' + b''.join(piece) + b'}'
+                piece, start = [], end + 1
+            count = (count + len(separators)) % self.members
+            if self.depth == 0:
+                # The closing brace ended the last piece, unless it falls on a cut
+                if count:
+                    piece.append(chunk[start:separators[-1]])
+                    text = b''.join(piece)
+                    if text.strip(b' \t\n\r'):
+                        yield b'{' + text + b'}'
+                return
+            piece.append(chunk[start:])
+            chunk = self._read()
+        raise ValueError("Unexpected end of JSON, unterminated object")
+
+
+def iter_json_object(file, chunk_size=CHUNK_SIZE, on_bytes=None, max_value_size=MAX_VALUE_SIZE):
+    """Yield the (key, value) pairs of the top-level object of a binary file"""
+    return iter(JsonObjectStream(file, chunk_size, on_bytes, max_value_size))
+
+
+def iter_json_pieces(file, members, chunk_size=CHUNK_SIZE, on_bytes=None, max_value_size=MAX_VALUE_SIZE):
+    """Yield the top-level object of a binary file as JSON objects of `members` members each"""
+    return iter(JsonObjectSplitter(file, members, chunk_size, on_bytes, max_value_size))
@@ -0,0 +1,148 @@
+"""
+Schema upgrades for databases built by earlier versions of the loader.
+
+`Base.metadata.create_all` only creates missing tables, so columns, keys and
+indexes added to models.py afterwards are applied here. Every migration is
+recorded in `schema_migrations` and runs once; each one also checks the live
+schema first, so a freshly created database just records them as applied.
+
+    python create_database/migrate.py
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Float, MetaData, String, Table, create_engine, inspect, select, text
+
+from aggregates import refresh_facet_aggregates
+from models import Base, FacetAggregate, Game, game_developer, game_publisher, game_category, game_genre, game_tag
+
+ASSOCIATION_TABLES = (game_developer, game_publisher, game_category, game_genre, game_tag)
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('id', String(64), primary_key=True),
+    Column('applied_at', DateTime),
+)
+
+
+def add_missing_columns(connection, table, names):
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    for name in names:
+        if name not in existing:
+            column = table.c[name]
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def create_missing_indexes(connection, table):
+    existing = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(connection)
+
+
+def add_game_derived_columns(connection):
+    add_missing_columns(connection, Game.__table__, (
+        'content_hash', 'owners_low', 'owners_high', 'release_year', 'review_ratio',
+    ))
+    # Backfill what can be derived in SQL; content_hash stays NULL so the next
+    # --incremental load treats every game as changed and fills it in.
+    connection.execute(text(
+        "UPDATE games SET release_year = YEAR(release_date) "
+        "WHERE release_year IS NULL AND release_date IS NOT NULL"
+    ))
+    connection.execute(text(
+        "UPDATE games SET "
+        "owners_low = CAST(TRIM(SUBSTRING_INDEX(estimated_owners, '-', 1)) AS UNSIGNED), "
+        "owners_high = CAST(TRIM(SUBSTRING_INDEX(estimated_owners, '-', -1)) AS UNSIGNED) "
+        "WHERE owners_low IS NULL AND estimated_owners LIKE '%-%'"
+    ))
+    connection.execute(text(
+        "UPDATE games SET review_ratio = "
+        "COALESCE(positive, 0) / NULLIF(COALESCE(positive, 0) + COALESCE(negative, 0), 0) "
+        "WHERE review_ratio IS NULL"
+    ))
+
+
+def add_game_indexes(connection):
+    create_missing_indexes(connection, Game.__table__)
+
+
+def add_association_keys(connection):
+    for table in ASSOCIATION_TABLES:
+        if not inspect(connection).get_pk_constraint(table.name)['constrained_columns']:
+            game_column, other_column = (column.name for column in table.primary_key.columns)
+            columns = f"{game_column}, {other_column}"
+            staging = f"{table.name}_dedup"
+            # The key can only be added once duplicate and dangling pairs are gone
+            connection.execute(text(
+                f"CREATE TABLE {staging} AS SELECT DISTINCT {columns} FROM {table.name} "
+                f"WHERE {game_column} IS NOT NULL AND {other_column} IS NOT NULL"
+            ))
+            connection.execute(text(f"DELETE FROM {table.name}"))
+            connection.execute(text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {staging}"))
+            connection.execute(text(f"DROP TABLE {staging}"))
+            connection.execute(text(f"ALTER TABLE {table.name} ADD PRIMARY KEY ({columns})"))
+        create_missing_indexes(connection, table)
+
+
+def add_tag_votes(connection):
+    add_missing_columns(connection, game_tag, ('votes',))
+    # Votes only come from the dump: make the next --incremental load rewrite every game
+    connection.execute(text("UPDATE games SET content_hash = NULL"))
+
+
+def key_facet_aggregates_by_price_band(connection):
+    table = FacetAggregate.__table__
+    if 'price_band' not in {column['name'] for column in inspect(connection).get_columns(table.name)}:
+        # Derived from games, so it is rebuilt rather than altered
+        table.drop(connection)
+        table.create(connection)
+        refresh_facet_aggregates(connection)
+
+
+def use_exact_game_numbers(connection):
+    # FLOAT kept 19.99 as 19.9899997..., which neither equals nor sorts after 19.99
+    table = Game.__table__
+    columns = {column['name']: column['type'] for column in inspect(connection).get_columns(table.name)}
+    if isinstance(columns['price'], Float):
+        for name in ('price', 'review_ratio'):
+            column_type = table.c[name].type.compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} MODIFY {name} {column_type}"))
+        # Recomputed at full precision rather than widened from the FLOAT values
+        connection.execute(text(
+            "UPDATE games SET review_ratio = "
+            "COALESCE(positive, 0) / NULLIF(COALESCE(positive, 0) + COALESCE(negative, 0), 0)"
+        ))
+
+
+MIGRATIONS = (
+    ('0001_game_derived_columns', add_game_derived_columns),
+    ('0002_game_indexes', add_game_indexes),
+    ('0003_association_keys', add_association_keys),
+    ('0004_facet_aggregates', refresh_facet_aggregates),
+    ('0005_tag_votes', add_tag_votes),
+    ('0006_facet_price_bands', key_facet_aggregates_by_price_band),
+    ('0007_exact_game_numbers', use_exact_game_numbers),
+)
+
+
+def upgrade(engine):
+    """Create missing tables, then apply the migrations not yet recorded"""
+    Base.metadata.create_all(engine)
+    schema_migrations.create(engine, checkfirst=True)
+
+    with engine.connect() as connection:
+        applied = set(connection.execute(select(schema_migrations.c.id)).scalars())
+        for migration_id, migrate in MIGRATIONS:
+            if migration_id in applied:
+                continue
+            print(f"Applying {migration_id}")
+            migrate(connection)
+            connection.execute(schema_migrations.insert().values(id=migration_id, applied_at=datetime.now()))
+            connection.commit()
+
+
+if __name__ == "__main__":
+    from create_database import DATABASE_URL
+
+    upgrade(create_engine(DATABASE_URL))
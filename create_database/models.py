@@ -1,38 +1,45 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, Table, ForeignKey, DateTime
+from sqlalchemy import BigInteger, Column, Integer, String, Float, Double, Numeric, Boolean, Text, Table, ForeignKey, DateTime, Index
 from sqlalchemy.dialects.mysql import JSON
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
 
-# Association tables for many-to-many relationships
+# Association tables for many-to-many relationships, keyed (game_id, x_id) with a
+# reverse (x_id, game_id) index for "games with tag X" style lookups
 game_developer = Table(
     'game_developer', Base.metadata,
-    Column('game_id', Integer, ForeignKey('games.id')),
-    Column('developer_id', Integer, ForeignKey('developers.id'))
+    Column('game_id', Integer, ForeignKey('games.id'), primary_key=True),
+    Column('developer_id', Integer, ForeignKey('developers.id'), primary_key=True),
+    Index('ix_game_developer_developer_id_game_id', 'developer_id', 'game_id'),
 )
 
 game_publisher = Table(
     'game_publisher', Base.metadata,
-    Column('game_id', Integer, ForeignKey('games.id')),
-    Column('publisher_id', Integer, ForeignKey('publishers.id'))
+    Column('game_id', Integer, ForeignKey('games.id'), primary_key=True),
+    Column('publisher_id', Integer, ForeignKey('publishers.id'), primary_key=True),
+    Index('ix_game_publisher_publisher_id_game_id', 'publisher_id', 'game_id'),
 )
 
 game_category = Table(
     'game_category', Base.metadata,
-    Column('game_id', Integer, ForeignKey('games.id')),
-    Column('category_id', Integer, ForeignKey('categories.id'))
+    Column('game_id', Integer, ForeignKey('games.id'), primary_key=True),
+    Column('category_id', Integer, ForeignKey('categories.id'), primary_key=True),
+    Index('ix_game_category_category_id_game_id', 'category_id', 'game_id'),
 )
 
 game_genre = Table(
     'game_genre', Base.metadata,
-    Column('game_id', Integer, ForeignKey('games.id')),
-    Column('genre_id', Integer, ForeignKey('genres.id'))
+    Column('game_id', Integer, ForeignKey('games.id'), primary_key=True),
+    Column('genre_id', Integer, ForeignKey('genres.id'), primary_key=True),
+    Index('ix_game_genre_genre_id_game_id', 'genre_id', 'game_id'),
 )
 
 game_tag = Table(
     'game_tag', Base.metadata,
-    Column('game_id', Integer, ForeignKey('games.id')),
-    Column('tag_id', Integer, ForeignKey('tags.id'))
+    Column('game_id', Integer, ForeignKey('games.id'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    Column('votes', Integer),  # user votes for the tag on the store page
+    Index('ix_game_tag_tag_id_game_id', 'tag_id', 'game_id'),
 )
 
 
@@ -42,9 +49,10 @@ class Game(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     game_id = Column(String(20), unique=True, nullable=False)  # 指定長度
     name = Column(String(255), nullable=False)
-    release_date = Column(DateTime)
+    release_date = Column(DateTime, index=True)
     required_age = Column(Integer)
-    price = Column(Float)
+    # Exact, so keyset cursors and price filters compare equal to the prices in games.json
+    price = Column(Numeric(10, 2, asdecimal=False), index=True)
     dlc_count = Column(Integer)
     detailed_description = Column(Text)
     about_the_game = Column(Text)
@@ -75,7 +83,13 @@ class Game(Base):
     average_playtime_2weeks = Column(Integer)
     median_playtime_forever = Column(Integer)
     median_playtime_2weeks = Column(Integer)
-    peak_ccu = Column(Integer)
+    peak_ccu = Column(Integer, index=True)
+    # Normalized at ingest time so filters and sorts are plain indexed comparisons
+    owners_low = Column(Integer, index=True)
+    owners_high = Column(Integer, index=True)
+    release_year = Column(Integer, index=True)
+    review_ratio = Column(Double, index=True)
+    content_hash = Column(String(64))  # sha256 of the source games.json entry
     packages = relationship("Package", back_populates="game")
     developers = relationship("Developer", secondary=game_developer, back_populates="games")
     publishers = relationship("Publisher", secondary=game_publisher, back_populates="games")
@@ -133,3 +147,70 @@ class Tag(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(255), unique=True)
     games = relationship("Game", secondary=game_tag, back_populates="tags")
+
+
+class DatasetMeta(Base):
+    __tablename__ = 'dataset_meta'
+
+    key = Column(String(64), primary_key=True)
+    value = Column(String(255))
+    updated_at = Column(DateTime)
+
+
+class ReviewHistogram(Base):
+    """Last Steam review histogram fetched for a game, see review_rollups for its points"""
+    __tablename__ = 'review_histograms'
+
+    game_id = Column(String(20), primary_key=True)  # Steam app id, as in games.game_id
+    start_date = Column(Integer)
+    end_date = Column(Integer)
+    rollup_type = Column(String(16))
+    count_all_reviews = Column(Boolean)
+    expand_graph = Column(Boolean)
+    fetched_at = Column(DateTime, index=True)
+
+
+class ReviewRollup(Base):
+    __tablename__ = 'review_rollups'
+
+    game_id = Column(String(20), primary_key=True)
+    series = Column(String(8), primary_key=True)  # 'rollups' or 'recent'
+    date = Column(Integer, primary_key=True)  # unix timestamp, as sent by Steam
+    recommendations_up = Column(Integer)
+    recommendations_down = Column(Integer)
+
+
+class FacetAggregate(Base):
+    """
+    Games per genre / category for every (release year, owners bucket, price
+    band) cell, rebuilt by the loader so the bar plots never join the
+    association tables. price_band is the lower edge of one of the
+    PRICE_BANDS of create_database/transform.py.
+    """
+    __tablename__ = 'facet_aggregates'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    facet = Column(String(16), nullable=False)  # 'genre' or 'category'
+    name = Column(String(255), nullable=False)
+    release_year = Column(Integer)
+    owners_low = Column(Integer)
+    owners_high = Column(Integer)
+    price_band = Column(Numeric(8, 2))  # exact, so it compares equal to the band edges
+    game_count = Column(Integer)
+    peak_ccu_count = Column(Integer)  # games with a known peak_ccu
+    peak_ccu_sum = Column(BigInteger)
+    __table_args__ = (
+        # Covers the year, price band and owners filters of /api/facets
+        Index('ix_facet_aggregates_facet_year_band_owners',
+              'facet', 'release_year', 'price_band', 'owners_low', 'owners_high'),
+    )
+
+
+class SimilarGame(Base):
+    """Top-k most similar games by tag profile, rebuilt by the loader"""
+    __tablename__ = 'similar_games'
+
+    game_id = Column(Integer, primary_key=True)  # games.id
+    rank = Column(Integer, primary_key=True)
+    similar_game_id = Column(Integer, nullable=False)  # games.id
+    score = Column(Float)
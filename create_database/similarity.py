@@ -0,0 +1,85 @@
+"""
+"Games like this" neighbours from tag votes, stored in similar_games.
+
+Every game is a TF-IDF vector over tags: the term frequency is 1 + log(votes)
+(1 when the dump has no votes) and the inverse document frequency
+log(games / games with the tag). Rows are L2-normalised, so cosine similarity
+is a sparse dot product. The all-pairs product is taken BLOCK_SIZE games at a
+time and only the top SIMILAR_K of every row are kept, so memory stays at one
+BLOCK_SIZE x games score block however large the catalogue is.
+"""
+from array import array
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import norm
+from sqlalchemy import delete, insert, select
+
+from models import SimilarGame, game_tag
+
+SIMILAR_K = 20
+BLOCK_SIZE = 256
+INSERT_BATCH = 10000
+
+
+def tag_matrix(connection):
+    """Game primary keys and their normalised TF-IDF rows"""
+    game_pks, tag_ids, votes = array('q'), array('q'), array('d')
+    result = connection.execution_options(yield_per=INSERT_BATCH).execute(
+        select(game_tag.c.game_id, game_tag.c.tag_id, game_tag.c.votes)
+    )
+    for game_pk, tag_id, tag_votes in result:
+        game_pks.append(game_pk)
+        tag_ids.append(tag_id)
+        votes.append(tag_votes if tag_votes and tag_votes > 0 else 1)
+
+    game_pks, rows = np.unique(np.frombuffer(game_pks, dtype=np.int64), return_inverse=True)
+    _, columns = np.unique(np.frombuffer(tag_ids, dtype=np.int64), return_inverse=True)
+    tf = 1 + np.log(np.frombuffer(votes, dtype=np.float64))
+    idf = np.log(len(game_pks) / np.bincount(columns)) if len(columns) else np.empty(0)
+
+    matrix = sparse.csr_matrix((tf * idf[columns], (rows, columns)), shape=(len(game_pks), len(idf)))
+    norms = norm(matrix, axis=1)
+    norms[norms == 0] = 1
+    return game_pks, (sparse.diags(1 / norms) @ matrix).astype(np.float32).tocsr()
+
+
+def top_neighbours(matrix, k=SIMILAR_K, block_size=BLOCK_SIZE):
+    """Yield (row, neighbour rows, scores) for every row, best neighbour first"""
+    count = matrix.shape[0]
+    k = min(k, count - 1)
+    if k <= 0:
+        return
+    for start in range(0, count, block_size):
+        rows = np.arange(start, min(start + block_size, count))
+        # Sparse x dense-block is far faster than sparse x sparse for this dense result
+        scores = np.ascontiguousarray((matrix @ matrix[rows].toarray().T).T)
+        scores[rows - start, rows] = -np.inf  # a game is not its own neighbour
+        top = np.argpartition(scores, count - k, axis=1)[:, count - k:]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        yield from zip(rows, np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1))
+
+
+def refresh_similar_games(connection):
+    """Rebuild similar_games from the current tag votes"""
+    table = SimilarGame.__table__
+    connection.execute(delete(table))
+    game_pks, matrix = tag_matrix(connection)
+
+    pending = []
+    for row, neighbours, scores in top_neighbours(matrix):
+        for rank, (neighbour, score) in enumerate(zip(neighbours.tolist(), scores.tolist()), start=1):
+            if score <= 0:
+                break  # no shared tags from here on
+            pending.append({
+                'game_id': int(game_pks[row]),
+                'rank': rank,
+                'similar_game_id': int(game_pks[neighbour]),
+                'score': score,
+            })
+        if len(pending) >= INSERT_BATCH:
+            connection.execute(insert(table), pending)
+            pending = []
+    if pending:
+        connection.execute(insert(table), pending)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import unicodedata
+from bisect import bisect_right
+from datetime import datetime
+from functools import lru_cache
+
+# games.json keys copied to `games` columns as they are, with the value stored when a key is missing
+GAME_DEFAULTS = {
+    'name': '', 'required_age': 0, 'price': 0.0, 'dlc_count': 0, 'detailed_description': '',
+    'about_the_game': '', 'short_description': '', 'reviews': '', 'header_image': '', 'website': '',
+    'support_url': '', 'support_email': '', 'windows': False, 'mac': False, 'linux': False,
+    'metacritic_score': 0, 'metacritic_url': '', 'achievements': 0, 'recommendations': 0, 'notes': '',
+    'supported_languages': [], 'full_audio_languages': [], 'screenshots': [], 'movies': [],
+    'user_score': 0.0, 'score_rank': '', 'positive': 0, 'negative': 0, 'estimated_owners': '',
+    'average_playtime_forever': 0, 'average_playtime_2weeks': 0, 'median_playtime_forever': 0,
+    'median_playtime_2weeks': 0, 'peak_ccu': 0,
+}
+
+# Lower edges of the price bands facet_aggregates is keyed by; the first band holds the free games
+PRICE_BANDS = (0.0, 0.01, 5.0, 10.0, 15.0, 20.0, 30.0, 40.0, 60.0, 100.0)
+
+
+def parse_date(date_str):
+    """Parse a games.json release date such as "Oct 21, 2008" or "Feb 2019"; None if it does not parse"""
+    for text, date_format in ((date_str, "%b %d, %Y"), (f"1 {date_str}", "%d %b %Y")):
+        try:
+            return datetime.strptime(text, date_format)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def parse_owners(owners_str):
+    """Split an estimated_owners range such as "20000 - 50000" into (low, high)"""
+    try:
+        low, high = owners_str.split('-')
+        return int(low.strip()), int(high.strip())
+    except (AttributeError, ValueError):
+        return None, None
+
+
+def price_band(price):
+    """Lower edge of the price band `price` falls in, or None for a missing price"""
+    if price is None:
+        return None
+    return PRICE_BANDS[max(bisect_right(PRICE_BANDS, price) - 1, 0)]
+
+
+@lru_cache(maxsize=65536)
+def name_key(name):
+    """
+    A developer, publisher, category, genre or tag name folded the way the
+    name columns' accent- and case-insensitive, trailing-space-padding
+    collation compares it: accents dropped (NFKD without the combining marks),
+    case folded and trailing spaces stripped. Names the unique index treats as
+    equal get the same key.
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().rstrip(' ')
+
+
+def review_ratio(positive, negative):
+    # Either count is null for games SteamSpy has no review data on
+    positive, negative = positive or 0, negative or 0
+    total = positive + negative
+    return positive / total if total else None
+
+
+def content_hash(game_data):
+    """Stable digest of a games.json entry, used to skip unchanged games on delta loads"""
+    canonical = json.dumps(game_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def game_columns(game_id, game_data):
+    """Map one games.json entry to the column values of its `games` row"""
+    release_date = parse_date(game_data.get('release_date', ''))
+    owners_low, owners_high = parse_owners(game_data.get('estimated_owners', ''))
+    columns = {name: game_data.get(name, default) for name, default in GAME_DEFAULTS.items()}
+    columns.update({
+        'game_id': game_id,
+        'release_date': release_date,
+        'owners_low': owners_low,
+        'owners_high': owners_high,
+        'release_year': release_date.year if release_date else None,
+        'review_ratio': review_ratio(game_data.get('positive', 0), game_data.get('negative', 0)),
+        'content_hash': content_hash(game_data),
+    })
+    return columns
+
+
+def package_columns(pkg):
+    return {
+        'title': pkg.get('title', ''),
+        'description': pkg.get('description', ''),
+        'subs': pkg.get('subs', []),
+    }
+
+
+def unique(names):
+    """Drop repeated names, keeping first-seen order (association rows are keyed per pair)"""
+    return list(dict.fromkeys(names))
+
+
+def tag_names(game_data):
+    """Tags are stored either as {name: votes} or as a plain list of names"""
+    tags = game_data.get('tags', {})
+    if isinstance(tags, dict):
+        return list(tags.keys())
+    elif isinstance(tags, list):
+        return unique(tags)
+    return []
+
+
+def tag_votes(game_data):
+    """(name, votes) pairs of a game's tags; votes is None when only names are given"""
+    tags = game_data.get('tags', {})
+    if isinstance(tags, dict):
+        return list(tags.items())
+    elif isinstance(tags, list):
+        return [(name, None) for name in unique(tags)]
+    return []
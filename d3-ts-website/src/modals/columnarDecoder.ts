@@ -0,0 +1,148 @@
+/**
+ * Decoder for the `application/vnd.steamvis.columnar` responses of the API
+ * (see data_server/columnar.py for the layout). Numeric columns are returned as
+ * typed array views over the response buffer, so decoding copies nothing.
+ */
+
+export type NumericColumn = Float64Array | Float32Array | Int32Array | Int16Array;
+
+export interface StringColumn {
+  length: number;
+  get(index: number): string | null;
+}
+
+export interface DictionaryColumn {
+  codes: Uint8Array | Uint16Array;
+  dictionary: (string | null)[];
+  get(index: number): string | null;
+}
+
+export interface DictionaryListColumn {
+  offsets: Uint32Array;
+  codes: Uint8Array | Uint16Array;
+  dictionary: (string | null)[];
+  get(index: number): string[];
+}
+
+export type ColumnarColumn = NumericColumn | StringColumn | DictionaryColumn | DictionaryListColumn;
+
+export interface ColumnarTable {
+  rows: number;
+  columns: { [name: string]: ColumnarColumn };
+  // Sentinel used for missing values in the integer columns (floats use NaN)
+  nullValues: { [name: string]: number };
+}
+
+interface ColumnHeader {
+  name: string;
+  type: string;
+  buffers: [number, number][];
+  null_value?: number;
+  nullable?: boolean;
+  code_type?: 'uint8' | 'uint16';
+  dictionary?: (string | null)[];
+}
+
+const MAGIC = 'SVC1';
+const ALIGNMENT = 8;
+const MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000;
+
+const codesView = (codeType: string | undefined, buffer: ArrayBuffer, offset: number, length: number) =>
+  codeType === 'uint16' ? new Uint16Array(buffer, offset, length / 2) : new Uint8Array(buffer, offset, length);
+
+const numericView = (type: string, buffer: ArrayBuffer, offset: number, length: number): NumericColumn => {
+  switch (type) {
+    case 'float64':
+      return new Float64Array(buffer, offset, length / 8);
+    case 'float32':
+      return new Float32Array(buffer, offset, length / 4);
+    case 'int32':
+    case 'epoch_days':
+      return new Int32Array(buffer, offset, length / 4);
+    case 'int16':
+      return new Int16Array(buffer, offset, length / 2);
+    default:
+      throw new Error(`Unknown columnar type ${type}`);
+  }
+};
+
+export const decodeColumnar = (buffer: ArrayBuffer): ColumnarTable => {
+  const decoder = new TextDecoder();
+  const magic = decoder.decode(new Uint8Array(buffer, 0, 4));
+  if (magic !== MAGIC) {
+    throw new Error('Not a columnar response');
+  }
+
+  const headerLength = new DataView(buffer).getUint32(4, true);
+  const header = JSON.parse(decoder.decode(new Uint8Array(buffer, 8, headerLength)));
+  const bodyStart = Math.ceil((8 + headerLength) / ALIGNMENT) * ALIGNMENT;
+
+  const table: ColumnarTable = { rows: header.rows, columns: {}, nullValues: {} };
+
+  (header.columns as ColumnHeader[]).forEach((column) => {
+    const [offset, length] = column.buffers[0];
+
+    if (column.type === 'string') {
+      const offsets = new Uint32Array(buffer, bodyStart + offset, length / 4);
+      const [dataOffset, dataLength] = column.buffers[1];
+      const data = new Uint8Array(buffer, bodyStart + dataOffset, dataLength);
+      // One bit per row, set when the row is not null
+      const validity = column.nullable
+        ? new Uint8Array(buffer, bodyStart + column.buffers[2][0], column.buffers[2][1])
+        : null;
+      table.columns[column.name] = {
+        length: offsets.length - 1,
+        get: (index: number) => {
+          if (validity && !(validity[index >> 3] & (1 << (index & 7)))) {
+            return null;
+          }
+          return decoder.decode(data.subarray(offsets[index], offsets[index + 1]));
+        },
+      };
+    } else if (column.type === 'dictionary') {
+      const codes = codesView(column.code_type, buffer, bodyStart + offset, length);
+      const dictionary = column.dictionary as (string | null)[];
+      table.columns[column.name] = { codes, dictionary, get: (index: number) => dictionary[codes[index]] };
+    } else if (column.type === 'dictionary_list') {
+      // Row i holds the names of codes[offsets[i]:offsets[i + 1]]
+      const offsets = new Uint32Array(buffer, bodyStart + offset, length / 4);
+      const [codesOffset, codesLength] = column.buffers[1];
+      const codes = codesView(column.code_type, buffer, bodyStart + codesOffset, codesLength);
+      const dictionary = column.dictionary as string[];
+      table.columns[column.name] = {
+        offsets,
+        codes,
+        dictionary,
+        get: (index: number) =>
+          Array.from(codes.subarray(offsets[index], offsets[index + 1]), (code) => dictionary[code]),
+      };
+    } else {
+      table.columns[column.name] = numericView(column.type, buffer, bodyStart + offset, length);
+      if (column.null_value !== undefined) {
+        table.nullValues[column.name] = column.null_value;
+      }
+    }
+  });
+
+  return table;
+};
+
+/** Value of a numeric column at `index`, or null where the column holds its null marker */
+export const numberAt = (table: ColumnarTable, name: string, index: number): number | null => {
+  const value = (table.columns[name] as NumericColumn)[index];
+  return isNaN(value) || value === table.nullValues[name] ? null : value;
+};
+
+/** Value of a string or dictionary column at `index` */
+export const stringAt = (table: ColumnarTable, name: string, index: number): string | null =>
+  (table.columns[name] as StringColumn | DictionaryColumn).get(index);
+
+/** The names of a dictionary_list column at `index` */
+export const listAt = (table: ColumnarTable, name: string, index: number): string[] =>
+  (table.columns[name] as DictionaryListColumn).get(index);
+
+/** An epoch_days column at `index` as a UTC date, or null */
+export const dateAt = (table: ColumnarTable, name: string, index: number): Date | null => {
+  const days = numberAt(table, name, index);
+  return days === null ? null : new Date(days * MILLISECONDS_PER_DAY);
+};
@@ -6,6 +6,11 @@ export type ScatterPlotData = {
   release_date: string;
   header_image: string;
   estimated_owners: string;
+  // Normalized numeric columns, only provided by the database API
+  owners_low?: number | null;
+  owners_high?: number | null;
+  release_year?: number | null;
+  review_ratio?: number | null;
   categories: string[];
   genres: string[];
 }
@@ -11,14 +11,32 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
-    CORS(app)
+    CORS(app, expose_headers=['X-Total-Count', 'X-Next-Cursor', 'ETag', 'Age'])
 
     db.init_app(app)
 
+    from .columnstore import memory_dataset
+    memory_dataset.init_app(app)
+
+    # Every read endpoint answers through this one backend
+    from .backends import init_backend
+    init_backend(app)
+
+    from .cache import game_details_cache, response_cache
+    response_cache.init_app(app)
+    game_details_cache.configure(app.config['GAME_DETAILS_CACHE_SIZE'], app.config['GAME_DETAILS_CACHE_TTL'])
+
+    from .upstream import review_histograms
+    review_histograms.init_app(app)
+
+    from .histograms import histogram_prefetcher
+    histogram_prefetcher.init_app(app)
+
     with app.app_context():
         from . import routes
         try:
-            db.create_all()
+            if memory_dataset.get() is None:
+                db.create_all()
         except sqlalchemy.exc.DatabaseError:
             print("Database not available, please make sure you have start the mariadb server (xampp) and try again.")
             # TODO Implement database creation logic
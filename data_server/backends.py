@@ -0,0 +1,238 @@
+"""
+The data source the read endpoints answer from, chosen once by create_app
+from DATA_SOURCE.
+
+DatabaseBackend runs SQL against MariaDB and MemoryBackend answers from the
+ColumnStore with the NumPy functions of memory.py. Both return rows shaped the
+same way, so the routes render them without knowing which one is in use.
+"""
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+
+from create_database.transform import GAME_DEFAULTS
+from . import db, memory
+from .cache import game_details_cache
+from .columnstore import memory_dataset
+from .dataset import bump_version, current_version
+from .models import FacetAggregate, Game, SimilarGame, Tag, game_tag
+from .queries import MEMBERSHIP_FILTERS, facet_filters, page_args, paginate, scatter_filters
+from .timeline import timeline_columns, timeline_query
+
+# Game columns returned by the details endpoint, named as in games.json; the
+# same ones the memory backend renders from GAME_DEFAULTS
+DETAIL_COLUMNS = ('game_id', 'release_date', *GAME_DEFAULTS)
+
+DETAIL_NAME_RELATIONS = ('developers', 'publishers', 'categories', 'genres')
+
+DETAIL_RELATIONS = tuple(
+    selectinload(getattr(Game, name)) for name in DETAIL_NAME_RELATIONS + ('packages',)
+)
+
+STREAM_PAGE_SIZE = 1000
+
+
+def game_details(game):
+    details = {name: getattr(game, name) for name in DETAIL_COLUMNS}
+    for name in DETAIL_NAME_RELATIONS:
+        details[name] = [item.name for item in getattr(game, name)]
+    # Tags come with their votes, as {name: votes} like in games.json
+    details['tags'] = dict(db.session.execute(
+        select(Tag.name, game_tag.c.votes)
+        .join(game_tag, game_tag.c.tag_id == Tag.id)
+        .where(game_tag.c.game_id == game.id)
+        .order_by(game_tag.c.votes.desc(), Tag.name)
+    ).all())
+    details['packages'] = [
+        {'title': package.title, 'description': package.description, 'subs': package.subs}
+        for package in game.packages
+    ]
+    return details
+
+
+class DatabaseBackend:
+    """Answers from MariaDB (DATA_SOURCE = 'database')"""
+
+    # Review histograms are kept in the database too
+    stores_histograms = True
+
+    def status(self):
+        try:
+            db.session.execute(select(1))
+            return 'online'
+        except OperationalError:
+            db.session.rollback()
+            return 'offline'
+
+    def has_game(self, game_id):
+        return db.session.execute(select(Game.id).where(Game.game_id == game_id)).scalar() is not None
+
+    def scatter_query(self, columns, args):
+        query = select(*columns).where(*scatter_filters(args))
+        return paginate(query, args)
+
+    def scatter_rows(self, columns, args):
+        """Scatter-plot rows of `columns` plus the keyset columns, and the page size"""
+        query, limit = self.scatter_query(columns, args)
+        return db.session.execute(query).all(), limit
+
+    def scatter_partitions(self, columns, args):
+        """
+        The whole scatter-plot result as partitions of rows, read through a
+        server-side cursor `STREAM_PAGE_SIZE` rows at a time while they are
+        iterated, and the row count.
+        """
+        query, _ = self.scatter_query(columns, args)
+        total = db.session.execute(select(func.count()).select_from(query.subquery())).scalar()
+
+        def partitions():
+            yield from db.session.execute(query.execution_options(yield_per=STREAM_PAGE_SIZE)).partitions()
+
+        return partitions(), total
+
+    def name_lists(self, facet, rows, args):
+        """
+        The sorted `facet` names of the game of every scatter-plot row, in one
+        query: over the same filters for the whole result, by primary key for a page.
+        """
+        model, table, column = next(filters for param, *filters in MEMBERSHIP_FILTERS if param == facet)
+        game_pks = [row[-1] for row in rows]
+        query = select(table.c.game_id, model.name).join(model, table.c[column] == model.id)
+        if page_args(args)[2] is None:
+            query = query.join(Game, Game.id == table.c.game_id).where(*scatter_filters(args))
+        else:
+            query = query.where(table.c.game_id.in_(game_pks))
+        names = {game_pk: [] for game_pk in game_pks}
+        for game_pk, name in db.session.execute(query.execution_options(yield_per=STREAM_PAGE_SIZE)):
+            names[game_pk].append(name)
+        return [sorted(names[game_pk]) for game_pk in game_pks]
+
+    def game_details(self, game_id):
+        """
+        The rendered details of a game, or None. The relations are eager-loaded
+        with one SELECT ... IN per relationship and the tags with their votes in
+        one more, so a miss costs a fixed seven queries; the body is then kept in
+        `game_details_cache` for the current dataset version.
+        """
+        key = (current_version(), game_id)
+        body = game_details_cache.get(key)
+        if body is None:
+            game = db.session.execute(
+                select(Game).where(Game.game_id == game_id).options(*DETAIL_RELATIONS)
+            ).scalar()
+            if game is None:
+                return None
+            body = current_app.json.dumps(game_details(game))
+            game_details_cache.put(key, body)
+        return body
+
+    def similar_games(self, game_id, columns, limit):
+        """Rows of `columns` plus the score from the similar_games table, or None for an unknown game"""
+        game_pk = db.session.execute(select(Game.id).where(Game.game_id == game_id)).scalar()
+        if game_pk is None:
+            return None
+        return db.session.execute(
+            select(*columns, SimilarGame.score)
+            .join(Game, Game.id == SimilarGame.similar_game_id)
+            .where(SimilarGame.game_id == game_pk, SimilarGame.rank <= limit)
+            .order_by(SimilarGame.rank)
+        ).all()
+
+    def timeline_columns(self, bucket, group_by, args):
+        # Games are counted per bin and distinct value in SQL, so only one row per value is sent
+        conditions = scatter_filters(args)
+        price_rows, peak_ccu_rows = (
+            db.session.execute(timeline_query(bucket, group_by, conditions, value)).all()
+            for value in (Game.price, Game.peak_ccu)
+        )
+        return timeline_columns(price_rows, peak_ccu_rows, group_by)
+
+    def facet_totals(self, facets, args):
+        """(name, game count, peak_ccu sum, peak_ccu count) rows per facet, from facet_aggregates"""
+        conditions = facet_filters(args)
+        return {
+            facet: db.session.execute(
+                select(
+                    FacetAggregate.name,
+                    func.sum(FacetAggregate.game_count),
+                    func.sum(FacetAggregate.peak_ccu_sum),
+                    func.sum(FacetAggregate.peak_ccu_count),
+                )
+                .where(FacetAggregate.facet == facet, *conditions)
+                .group_by(FacetAggregate.name)
+            ).all()
+            for facet in facets
+        }
+
+    def new_version(self):
+        bump_version()
+        return True
+
+
+class MemoryBackend:
+    """Answers from the ColumnStore of `memory_dataset` (DATA_SOURCE = 'memory')"""
+
+    # There is no table to keep review histograms in
+    stores_histograms = False
+
+    @property
+    def store(self):
+        # Looked up on every call, as reload_dataset replaces the store
+        return memory_dataset.get()
+
+    def status(self):
+        return 'online'
+
+    def has_game(self, game_id):
+        return self.store.find(game_id) is not None
+
+    def scatter_rows(self, columns, args):
+        return memory.scatter_rows(self.store, [column.key for column in columns], args)
+
+    def scatter_partitions(self, columns, args):
+        rows, _ = self.scatter_rows(columns, args)
+        return [rows], len(rows)
+
+    def name_lists(self, facet, rows, args):
+        # The primary key is the ordinal plus one
+        ordinals = np.array([row[-1] for row in rows], dtype=np.int64) - 1
+        return memory.name_lists(self.store, facet, ordinals)
+
+    def game_details(self, game_id):
+        # The column store keeps every body rendered already
+        ordinal = self.store.find(game_id)
+        return None if ordinal is None else self.store.details(ordinal)
+
+    def similar_games(self, game_id, columns, limit):
+        """The same scores as the similar_games table, computed for the one game on request"""
+        ordinal = self.store.find(game_id)
+        if ordinal is None:
+            return None
+        return memory.similar_games(self.store, ordinal, [column.key for column in columns], limit)
+
+    def timeline_columns(self, bucket, group_by, args):
+        return memory.timeline_columns(self.store, bucket, group_by, args)
+
+    def facet_totals(self, facets, args):
+        mask = memory.facet_mask(self.store, args)
+        return {facet: memory.facet_totals(self.store, facet, mask) for facet in facets}
+
+    def new_version(self):
+        # The dataset version changes with the snapshot only
+        return False
+
+
+BACKENDS = {
+    'database': DatabaseBackend,
+    'memory': MemoryBackend,
+}
+
+
+def init_backend(app):
+    app.extensions['backend'] = BACKENDS[app.config['DATA_SOURCE']]()
+
+
+def get_backend():
+    return current_app.extensions['backend']
@@ -0,0 +1,216 @@
+"""
+Bitmap membership index for category, genre and tag filters.
+
+Games get dense ordinals (their position in games.id order) and every
+category, genre and tag one bitset over those ordinals, held as a Python int so
+AND / OR / NOT are single big-integer operations. Numeric filters are turned
+into bitsets with one vectorised comparison, so any combination of filters is
+a handful of bitwise operations before the matching rows are read out.
+
+Filter expressions look like
+
+    genre:Action AND (category:"Multi-player" OR tag:Co-op) AND NOT tag:"Early Access"
+
+with NOT binding tightest, then AND, then OR.
+"""
+import re
+
+import numpy as np
+from sqlalchemy import select
+
+from create_database.transform import name_key
+from . import db
+from .columnstore import memory_dataset
+from .dataset import VersionedIndex
+from .models import Game, Category, Genre, Tag, game_category, game_genre, game_tag
+from .queries import InvalidParameter, number_arg, owners_bucket
+from .spatial import ROW_COLUMNS, ROW_KEYS
+
+# expression prefix -> (dimension model, association table, association column)
+FACETS = {
+    'category': (Category, game_category, 'category_id'),
+    'genre': (Genre, game_genre, 'genre_id'),
+    'tag': (Tag, game_tag, 'tag_id'),
+}
+
+# (query parameter prefix, numeric column) for the `<prefix>_min` / `<prefix>_max` filters
+RANGE_COLUMNS = (('year', 'release_year'), ('price', 'price'), ('peak_ccu', 'peak_ccu'))
+
+TOKEN = re.compile(r'\s*(?:(\()|(\))|(\w+):(?:"([^"]*)"|([^\s()"]+))|(\S+))')
+
+
+def to_bitset(mask):
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def to_ordinals(bitset, count):
+    packed = np.frombuffer(bitset.to_bytes((count + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(packed, count=count, bitorder='little'))
+
+
+def tokenize(expression):
+    """('(' | ')' | 'AND' | 'OR' | 'NOT' | (facet, name)) tokens of a filter expression"""
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        opening, closing, facet, quoted, bare, word = match.groups()
+        if opening or closing:
+            tokens.append(opening or closing)
+        elif facet:
+            if facet not in FACETS:
+                raise InvalidParameter(f"Unknown filter {facet!r}, expected one of {', '.join(FACETS)}")
+            tokens.append((facet, quoted if quoted is not None else bare))
+        elif word.upper() in ('AND', 'OR', 'NOT'):
+            tokens.append(word.upper())
+        else:
+            raise InvalidParameter(f"Unexpected {word!r} in filter expression")
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    """Recursive-descent evaluation of a filter expression straight to a bitset"""
+
+    def __init__(self, tokens, index):
+        self.tokens = tokens
+        self.position = 0
+        self.index = index
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise InvalidParameter("Filter expression ends unexpectedly")
+        self.position += 1
+        return token
+
+    def parse(self):
+        bitset = self.parse_or()
+        if self.peek() is not None:
+            raise InvalidParameter(f"Unexpected {self.peek()!r} in filter expression")
+        return bitset
+
+    def parse_or(self):
+        bitset = self.parse_and()
+        while self.peek() == 'OR':
+            self.take()
+            bitset |= self.parse_and()
+        return bitset
+
+    def parse_and(self):
+        bitset = self.parse_not()
+        while self.peek() == 'AND':
+            self.take()
+            bitset &= self.parse_not()
+        return bitset
+
+    def parse_not(self):
+        if self.peek() == 'NOT':
+            self.take()
+            return self.index.everything & ~self.parse_not()
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.take()
+        if token == '(':
+            bitset = self.parse_or()
+            if self.take() != ')':
+                raise InvalidParameter("Missing ')' in filter expression")
+            return bitset
+        if isinstance(token, tuple):
+            facet, name = token
+            return self.index.bitsets[facet].get(name_key(name), 0)
+        raise InvalidParameter(f"Unexpected {token!r} in filter expression")
+
+
+class BitmapIndex:
+    """
+    `rows` are the games in ordinal order, `columns` their numeric filter
+    columns by name and `memberships` the (game pk, name) pairs per facet.
+    """
+
+    def __init__(self, game_pks, rows, columns, memberships):
+        self.rows = rows
+        self.count = len(rows)
+        self.everything = (1 << self.count) - 1
+        # NULLs become NaN, which fails every comparison just like in SQL
+        self.columns = {
+            name: np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+            for name, values in columns.items()
+        }
+        self.bitsets = {}
+        for facet, pairs in memberships.items():
+            by_name = {}
+            # Keyed like the database's collation compares names
+            for game_pk, name in pairs:
+                by_name.setdefault(name_key(name), []).append(game_pk)
+            self.bitsets[facet] = {}
+            for name, pks in by_name.items():
+                mask = np.zeros(self.count, dtype=bool)
+                mask[np.searchsorted(game_pks, pks)] = True
+                self.bitsets[facet][name] = to_bitset(mask)
+
+    def numeric_bitset(self, args):
+        """Bitset of the games passing the year, price, peak_ccu and owners filters in `args`"""
+        mask = None
+        for prefix, column in RANGE_COLUMNS:
+            values = self.columns[column]
+            for suffix, compare in (('min', np.greater_equal), ('max', np.less_equal)):
+                bound = number_arg(args, f'{prefix}_{suffix}')
+                if bound is not None:
+                    passing = compare(values, bound)
+                    mask = passing if mask is None else mask & passing
+        owners = [owners_bucket(value) for value in args.getlist('owners')]
+        if owners:
+            passing = np.zeros(self.count, dtype=bool)
+            for low, high in owners:
+                passing |= (self.columns['owners_low'] == low) & (self.columns['owners_high'] == high)
+            mask = passing if mask is None else mask & passing
+        return self.everything if mask is None else to_bitset(mask)
+
+    def evaluate(self, expression, args):
+        """Ordinals of the games matching the filter expression and the numeric filters"""
+        bitset = self.numeric_bitset(args)
+        if expression and expression.strip():
+            bitset &= Parser(tokenize(expression), self).parse()
+        return to_ordinals(bitset, self.count)
+
+
+def build_store_bitmap_index(store):
+    ordinals = np.arange(store.count)
+    columns = {name: store.column(name, ordinals) for name in ('owners_low', 'owners_high')}
+    columns.update((name, store.column(name, ordinals)) for _, name in RANGE_COLUMNS)
+    memberships = {}
+    for facet in FACETS:
+        membership = store.memberships[facet]
+        games, codes = membership.links()
+        memberships[facet] = zip((games + 1).tolist(), [membership.names[code] for code in codes.tolist()])
+    return BitmapIndex(ordinals + 1, store.rows(ROW_KEYS, ordinals), columns, memberships)
+
+
+def build_bitmap_index():
+    store = memory_dataset.get()
+    if store is not None:
+        return build_store_bitmap_index(store)
+    result = db.session.execute(
+        select(Game.id, Game.owners_low, Game.owners_high, *ROW_COLUMNS).order_by(Game.id)
+    ).all()
+    game_pks = np.array([row[0] for row in result], dtype=np.int64)
+    rows = [tuple(row[3:]) for row in result]
+    columns = {'owners_low': [row[1] for row in result], 'owners_high': [row[2] for row in result]}
+    for _, name in RANGE_COLUMNS:
+        position = ROW_KEYS.index(name)
+        columns[name] = [row[position] for row in rows]
+
+    memberships = {
+        facet: db.session.execute(select(table.c.game_id, model.name).join(model, model.id == table.c[column])).all()
+        for facet, (model, table, column) in FACETS.items()
+    }
+    return BitmapIndex(game_pks, rows, columns, memberships)
+
+
+bitmap_index = VersionedIndex(build_bitmap_index)
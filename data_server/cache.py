@@ -0,0 +1,294 @@
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from .dataset import current_version
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, without it only gzip variants are kept
+    brotli = None
+
+# Response headers that are part of a cached entry
+CACHED_HEADERS = ('X-Next-Cursor', 'X-Total-Count')
+
+# Content codings in order of preference when the client accepts several
+ENCODINGS = ('br', 'gzip')
+
+# Request headers a cached response depends on: the key includes Accept, which
+# picks the response format, and the variant served depends on Accept-Encoding
+VARY = ('Accept', 'Accept-Encoding')
+
+
+def variant_etag(etag, encoding):
+    # Every representation needs its own strong ETag
+    return etag if encoding == 'identity' else f'{etag}-{encoding}'
+
+
+class CachedResponse:
+    """A rendered response body together with its precompressed variants"""
+
+    def __init__(self, variants, mimetype, headers, etag):
+        self.variants = variants
+        self.mimetype = mimetype
+        self.headers = headers
+        self.etag = etag
+
+    @property
+    def size(self):
+        return sum(len(body) for body in self.variants.values())
+
+    def negotiate(self):
+        encodings = [encoding for encoding in ENCODINGS if encoding in self.variants]
+        return request.accept_encodings.best_match(encodings) or 'identity'
+
+    def to_response(self, encoding):
+        response = Response(self.variants[encoding], mimetype=self.mimetype, headers=self.headers)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(variant_etag(self.etag, encoding))
+        response.vary.update(VARY)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+class ResponseCache:
+    """
+    In-process LRU of rendered list responses, bounded by total body size.
+
+    Entries belong to one dataset version: the first lookup after the loader
+    bumps the version drops everything. ETags are derived from the version and
+    the request key alone, so every server process hands out the same ETag for
+    the same response, and a matching If-None-Match is answered with 304
+    before the view runs at all.
+
+    Bodies are compressed with gzip (and brotli when installed) once, when the
+    entry is stored, so serving a compressed response costs no CPU.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.min_compress_bytes = 1024
+        self.gzip_level = 9
+        self.brotli_quality = 9
+        self.entries = OrderedDict()
+        self.size = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.served = {encoding: 0 for encoding in ('identity',) + ENCODINGS}
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_bytes = app.config['RESPONSE_CACHE_MAX_BYTES']
+        self.min_compress_bytes = app.config['RESPONSE_CACHE_MIN_COMPRESS_BYTES']
+        self.gzip_level = app.config['RESPONSE_CACHE_GZIP_LEVEL']
+        self.brotli_quality = app.config['RESPONSE_CACHE_BROTLI_QUALITY']
+        app.extensions['response_cache'] = self
+
+    def build_entry(self, body, mimetype, headers, etag):
+        variants = {'identity': body}
+        if len(body) >= self.min_compress_bytes:
+            variants['gzip'] = gzip.compress(body, compresslevel=self.gzip_level)
+            if brotli is not None:
+                variants['br'] = brotli.compress(body, quality=self.brotli_quality)
+        return CachedResponse(variants, mimetype, headers, etag)
+
+    def _use_version(self, version):
+        if version != self.version:
+            self.entries.clear()
+            self.size = 0
+            self.version = version
+
+    def etag(self, version, key):
+        return hashlib.sha256(repr((version, key)).encode('utf-8')).hexdigest()
+
+    def get(self, version, key):
+        with self.lock:
+            self._use_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, version, key, entry):
+        with self.lock:
+            # Rendered before a lookup moved the cache on to a newer version
+            if version != self.version or entry.size > self.max_bytes:
+                return
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            self.entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def record_served(self, encoding):
+        with self.lock:
+            self.served[encoding] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            identity_bytes = sum(len(entry.variants['identity']) for entry in self.entries.values())
+            compression = {}
+            for encoding in ENCODINGS:
+                compressed = [entry.variants for entry in self.entries.values() if encoding in entry.variants]
+                if compressed:
+                    compression[encoding] = (
+                        sum(len(variants[encoding]) for variants in compressed)
+                        / sum(len(variants['identity']) for variants in compressed)
+                    )
+            return {
+                'version': self.version,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'identity_bytes': identity_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'served': dict(self.served),
+                'compression_ratio': compression,
+                'brotli_available': brotli is not None,
+                'game_details': game_details_cache.stats(),
+            }
+
+    def clear(self):
+        """Drop every entry of this process"""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+        game_details_cache.clear()
+
+
+class TTLCache:
+    """Thread-safe LRU of at most `max_entries` values that also expire `ttl` seconds after being stored"""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def configure(self, max_entries, ttl):
+        with self.lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self.entries.clear()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None or time.monotonic() - item[0] > self.ttl:
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.monotonic(), value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'max_entries': self.max_entries, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+response_cache = ResponseCache()
+
+# Rendered /api/game_details bodies keyed by (dataset version, game_id)
+game_details_cache = TTLCache()
+
+
+def request_key():
+    args = tuple(sorted(request.args.items(multi=True)))
+    return request.endpoint, tuple(sorted(request.view_args.items())), args, request.headers.get('Accept', '')
+
+
+def cache_stream(response, version, key, etag):
+    """
+    Pass a streamed response through unchanged and store its body once it has
+    been sent in full, so only the first request per dataset version streams
+    from the database. A body that outgrows the cache is not kept, and neither
+    is one the client stopped reading.
+    """
+    body = response.iter_encoded()
+    headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+
+    def generate():
+        chunks = []
+        size = 0
+        for chunk in body:
+            yield chunk
+            if chunks is not None:
+                size += len(chunk)
+                if size > response_cache.max_bytes:
+                    chunks = None
+                else:
+                    chunks.append(chunk)
+        if chunks is not None:
+            entry = response_cache.build_entry(b''.join(chunks), response.mimetype, headers, etag)
+            response_cache.put(version, key, entry)
+
+    response.response = generate()
+    response.set_etag(etag)
+    response.vary.update(VARY)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def cached_response(view):
+    """Serve a GET view from `response_cache`, with ETag / If-None-Match support"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = current_version()
+        key = request_key()
+        etag = response_cache.etag(version, key)
+
+        for encoding in ('identity',) + ENCODINGS:
+            if request.if_none_match.contains(variant_etag(etag, encoding)):
+                response = Response(status=304)
+                response.set_etag(variant_etag(etag, encoding))
+                response.vary.update(VARY)
+                return response
+
+        entry = response_cache.get(version, key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            # Errors are passed through untouched
+            if response.status_code != 200:
+                return response
+            if response.is_streamed:
+                return cache_stream(response, version, key, etag)
+            headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+            entry = response_cache.build_entry(response.get_data(), response.mimetype, headers, etag)
+            response_cache.put(version, key, entry)
+
+        encoding = entry.negotiate()
+        response_cache.record_served(encoding)
+        return entry.to_response(encoding)
+
+    return wrapper
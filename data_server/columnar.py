@@ -0,0 +1,174 @@
+"""
+Compact columnar binary encoding for list endpoints.
+
+Layout (all integers little-endian):
+
+    b'SVC1' | uint32 header length | JSON header | padding | column buffers
+
+The body starts at the first 8-byte boundary after the header, and every
+buffer inside it is 8-byte aligned, so a browser can wrap each one in a typed
+array view without copying. The header lists the row count and, per column,
+its type and the `[offset, length]` of its buffers relative to the body:
+
+    float64 / float32 / int32 / int16   one buffer of packed values; nulls are
+                                        NaN for floats and `null_value` for ints
+    epoch_days                          int32 days since 1970-01-01
+    string                              uint32 offsets (rows + 1) and UTF-8 bytes,
+                                        plus a validity bitmap when `nullable`
+    dictionary                          uint8 or uint16 codes into `dictionary`
+    dictionary_list                     uint32 offsets (rows + 1) into uint8 or
+                                        uint16 codes into `dictionary`, for a
+                                        list of names per row
+
+A validity bitmap holds one bit per row, least significant bit first, set
+when the row has a value; it tells null strings apart from empty ones.
+"""
+import json
+import math
+import struct
+import sys
+from array import array
+from datetime import datetime
+
+MAGIC = b'SVC1'
+COLUMNAR_MIMETYPE = 'application/vnd.steamvis.columnar'
+ALIGNMENT = 8
+EPOCH = datetime(1970, 1, 1)
+
+# type name -> (array typecode, null replacement)
+NUMERIC_TYPES = {
+    'float64': ('d', math.nan),
+    'float32': ('f', math.nan),
+    'int32': ('i', -2 ** 31),
+    'int16': ('h', -2 ** 15),
+}
+
+# (column key, encoding) for the scatter-plot rows; the owners bucket travels as a
+# dictionary id and release dates as epoch days
+SCATTER_PLOT_ENCODING = (
+    ('game_id', 'string'),
+    ('name', 'string'),
+    ('release_date', 'epoch_days'),
+    ('price', 'float64'),
+    ('header_image', 'string'),
+    ('peak_ccu', 'int32'),
+    ('estimated_owners', 'dictionary'),
+    ('owners_low', 'int32'),
+    ('owners_high', 'int32'),
+    ('release_year', 'int16'),
+    ('review_ratio', 'float32'),
+    ('categories', 'dictionary_list'),
+    ('genres', 'dictionary_list'),
+)
+
+
+def little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_numeric(values, column_type):
+    typecode, null = NUMERIC_TYPES[column_type]
+    packed = array(typecode, (null if value is None else value for value in values))
+    column = {'type': column_type}
+    if not isinstance(null, float):
+        column['null_value'] = null
+    return column, [little_endian(packed)]
+
+
+def encode_epoch_days(values):
+    null = NUMERIC_TYPES['int32'][1]
+    days = array('i', (null if value is None else (value - EPOCH).days for value in values))
+    return {'type': 'epoch_days', 'null_value': null}, [little_endian(days)]
+
+
+def encode_strings(values):
+    offsets = array('I', [0])
+    data = bytearray()
+    validity = bytearray((len(values) + 7) // 8)
+    nullable = False
+    for row, value in enumerate(values):
+        if value is None:
+            nullable = True
+        else:
+            data += value.encode('utf-8')
+            validity[row >> 3] |= 1 << (row & 7)
+        offsets.append(len(data))
+    buffers = [little_endian(offsets), bytes(data)]
+    if nullable:
+        buffers.append(bytes(validity))
+    return {'type': 'string', 'nullable': nullable}, buffers
+
+
+def dictionary_codes(column_type, codes_by_value, codes):
+    typecode, code_type = ('B', 'uint8') if len(codes_by_value) <= 256 else ('H', 'uint16')
+    column = {'type': column_type, 'code_type': code_type, 'dictionary': list(codes_by_value)}
+    return column, little_endian(array(typecode, codes))
+
+
+def encode_dictionary(values):
+    codes_by_value = {}
+    codes = [codes_by_value.setdefault(value, len(codes_by_value)) for value in values]
+    column, codes = dictionary_codes('dictionary', codes_by_value, codes)
+    return column, [codes]
+
+
+def encode_dictionary_lists(values):
+    codes_by_value = {}
+    offsets = array('I', [0])
+    codes = []
+    for names in values:
+        codes.extend(codes_by_value.setdefault(name, len(codes_by_value)) for name in names)
+        offsets.append(len(codes))
+    column, codes = dictionary_codes('dictionary_list', codes_by_value, codes)
+    return column, [little_endian(offsets), codes]
+
+
+def encode_column(values, encoding):
+    if encoding in NUMERIC_TYPES:
+        return encode_numeric(values, encoding)
+    if encoding == 'epoch_days':
+        return encode_epoch_days(values)
+    if encoding == 'string':
+        return encode_strings(values)
+    if encoding == 'dictionary':
+        return encode_dictionary(values)
+    if encoding == 'dictionary_list':
+        return encode_dictionary_lists(values)
+    raise ValueError(f"Unknown column encoding {encoding!r}")
+
+
+def padding(length):
+    return b'\0' * (-length % ALIGNMENT)
+
+
+def encode_columnar(rows, keys, encoding=SCATTER_PLOT_ENCODING, name_lists=None):
+    """
+    Encode result rows column by column.
+
+    `rows` are the tuples of a query result whose leading columns are named
+    by `keys`; they are transposed directly without building per-row dicts.
+    `name_lists` holds the values of the columns kept outside the rows, such
+    as the category names of every row, by key.
+    """
+    positions = {key: index for index, key in enumerate(keys)}
+    columns = list(zip(*rows)) if rows else [() for _ in keys]
+    name_lists = name_lists or {}
+
+    header_columns = []
+    body = bytearray()
+    for key, column_encoding in encoding:
+        values = name_lists[key] if key in name_lists else columns[positions[key]]
+        column, buffers = encode_column(values, column_encoding)
+        column['name'] = key
+        column['buffers'] = []
+        for buffer in buffers:
+            column['buffers'].append([len(body), len(buffer)])
+            body += buffer
+            body += padding(len(body))
+        header_columns.append(column)
+
+    header = json.dumps({'rows': len(rows), 'columns': header_columns}, separators=(',', ':')).encode('utf-8')
+    prefix = MAGIC + struct.pack('<I', len(header)) + header
+    return prefix + padding(len(prefix)) + bytes(body)
@@ -0,0 +1,403 @@
+"""
+Column store the server answers from when DATA_SOURCE is 'memory'.
+
+The dataset is held column by column instead of as rows or objects: numbers in
+typed NumPy arrays, where the smallest value of the type (NaN for floats)
+stands for NULL like in the columnar response encoding; strings packed into
+one UTF-8 buffer with an offsets array; the owners bucket as codes into an
+interned table; and the category, genre and tag links of every game CSR style,
+as codes into interned name tables. Game details are kept as their rendered
+JSON. Ordinal i is the game with primary key i + 1, in the order the games
+were read, so `sort=id` pages the same way as with the database.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import cached_property, lru_cache
+
+import numpy as np
+from werkzeug.http import http_date
+
+from create_database.transform import (
+    GAME_DEFAULTS, PRICE_BANDS, name_key, package_columns, parse_date, parse_owners, review_ratio, tag_votes,
+    unique,
+)
+
+log = logging.getLogger(__name__)
+
+DATA_SOURCES = ('database', 'memory')
+
+EPOCH = datetime(1970, 1, 1)
+CHUNK_FILE = re.compile(r'chunk_(\d+)\.json$')
+
+# numeric column -> dtype; release_date is held as days since EPOCH
+NUMERIC_COLUMNS = {
+    'price': np.float64,
+    'peak_ccu': np.int32,
+    'release_year': np.int16,
+    'release_date': np.int32,
+    'review_ratio': np.float64,
+}
+
+STRING_COLUMNS = ('game_id', 'name', 'header_image', 'short_description', 'details')
+
+# facet -> its key in games.json
+FACETS = {
+    'category': 'categories',
+    'genre': 'genres',
+    'tag': 'tags',
+}
+
+# Name lists of the details response; its other game columns are those of
+# create_database/transform.py's GAME_DEFAULTS, so both data sources render the same
+DETAIL_NAME_LISTS = ('developers', 'publishers', 'categories', 'genres')
+
+
+def null_value(dtype):
+    return np.nan if np.issubdtype(dtype, np.floating) else np.iinfo(dtype).min
+
+
+@lru_cache(maxsize=None)
+def row_type(keys):
+    # rename=True lets a query select the same column twice, as the paged scatter rows do
+    return namedtuple('Row', keys, rename=True)
+
+
+class StringColumn:
+    """UTF-8 strings in one buffer; string i is data[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def pack(cls, values):
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(offsets, b''.join(encoded))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+    def raw(self, index):
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+    def take(self, ordinals):
+        data = self.data
+        starts = self.offsets[ordinals].tolist()
+        ends = self.offsets[ordinals + 1].tolist()
+        return [str(data[start:end], 'utf-8') for start, end in zip(starts, ends)]
+
+    def tolist(self):
+        return self.take(np.arange(len(self)))
+
+
+class Membership:
+    """
+    Links of every game into an interned name table: game i links to
+    codes[offsets[i]:offsets[i + 1]]. Tags also carry their votes.
+    """
+
+    def __init__(self, names, offsets, codes, votes=None):
+        self.names = names
+        self.offsets = offsets
+        self.codes = codes
+        self.votes = votes
+        # Names are matched by name_key, like the database's collation compares them
+        self.key_of = {}
+        self.key_codes = np.array(
+            [self.key_of.setdefault(name_key(name), len(self.key_of)) for name in names], dtype=np.int64,
+        )
+
+    @cached_property
+    def link_games(self):
+        """Ordinal of the game of every link"""
+        return np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+
+    def links(self, mask=None):
+        """(game ordinal, name code) of every link, of the games in `mask` if given"""
+        if mask is None:
+            return self.link_games, self.codes
+        selected = mask[self.link_games]
+        return self.link_games[selected], self.codes[selected]
+
+    def having(self, names, mode):
+        """Mask of the games linked to any (or all) of the names"""
+        keys = {name_key(name) for name in names}
+        wanted = [self.key_of[key] for key in keys if key in self.key_of]
+        link_keys = self.key_codes[self.codes]
+        selected = np.isin(link_keys, wanted)
+        # A game linked to two spellings of one name still counts it once
+        pairs = np.unique(self.link_games[selected] * len(self.key_of) + link_keys[selected])
+        counts = np.bincount(pairs // max(len(self.key_of), 1), minlength=len(self.offsets) - 1)
+        # Unknown names still count for 'all', which then matches nothing, as in SQL
+        return counts == len(keys) if mode == 'all' else counts > 0
+
+    @cached_property
+    def by_name(self):
+        """(link positions sorted by name code, start of every code in them)"""
+        order = np.argsort(self.codes, kind='stable')
+        starts = np.zeros(len(self.names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.codes, minlength=len(self.names)), out=starts[1:])
+        return order, starts
+
+    @cached_property
+    def weights(self):
+        """
+        TF-IDF weight of every link, L2-normalised per game, computed as in
+        create_database/similarity.py: tf = 1 + log(votes), idf = log(games / games with the name)
+        """
+        votes = np.ones(len(self.codes)) if self.votes is None else self.votes.astype(np.float64)
+        votes[votes <= 0] = 1  # also the NULL sentinel of list-style tags
+        document_count = np.count_nonzero(np.diff(self.offsets))
+        frequency = np.bincount(self.codes, minlength=len(self.names))
+        with np.errstate(divide='ignore'):
+            idf = np.log(document_count / frequency)
+        weights = (1 + np.log(votes)) * idf[self.codes]
+        norms = np.sqrt(np.bincount(self.link_games, weights=weights ** 2, minlength=len(self.offsets) - 1))
+        norms[norms == 0] = 1
+        return weights / norms[self.link_games]
+
+
+class ColumnStore:
+    def __init__(self, version, numbers, strings, owner_codes, owner_names, memberships, id_order=None):
+        self.version = version
+        self.numbers = numbers
+        self.strings = strings
+        self.owner_codes = owner_codes
+        self.owner_names = owner_names
+        self.memberships = memberships
+        self.count = len(strings['game_id'])
+        if id_order is None:
+            id_order = np.array(sorted(range(self.count), key=strings['game_id'].__getitem__), dtype=np.int64)
+        self.id_order = id_order
+        self._values = {}
+
+    def warm(self):
+        """Compute the lazily derived arrays now, e.g. before worker processes fork"""
+        for name in list(self.numbers) + ['id', 'owners_low', 'owners_high', 'price_band']:
+            self.values(name)
+        for membership in self.memberships.values():
+            for name in ('link_games', 'by_name', 'weights'):
+                getattr(membership, name)
+
+    def find(self, game_id):
+        """Ordinal of the game with this Steam id, or None"""
+        game_ids = self.strings['game_id']
+        index = bisect_left(self.id_order, game_id, key=lambda ordinal: game_ids[ordinal])
+        if index < self.count and game_ids[self.id_order[index]] == game_id:
+            return int(self.id_order[index])
+        return None
+
+    def details(self, ordinal):
+        return self.strings['details'].raw(ordinal)
+
+    def owner_bounds(self):
+        """(low, high) of every interned owners bucket, NaN where it does not parse"""
+        bounds = np.array([parse_owners(name) for name in self.owner_names], dtype=np.float64)
+        return bounds.reshape(-1, 2)
+
+    def values(self, name):
+        """A numeric column as float64 with NULLs as NaN, for filtering and sorting"""
+        values = self._values.get(name)
+        if values is None:
+            if name == 'id':
+                values = np.arange(1, self.count + 1, dtype=np.float64)
+            elif name in ('owners_low', 'owners_high'):
+                values = self.owner_bounds()[:, 1 if name == 'owners_high' else 0][self.owner_codes]
+            elif name == 'price_band':
+                # transform.price_band of every price, keeping NaN
+                price = self.values('price')
+                edges = np.array(PRICE_BANDS)
+                values = edges[np.maximum(np.searchsorted(edges, price, side='right') - 1, 0)]
+                values[np.isnan(price)] = np.nan
+            else:
+                column = self.numbers[name]
+                values = column.astype(np.float64)
+                if not np.issubdtype(column.dtype, np.floating):
+                    values[column == null_value(column.dtype)] = np.nan
+            self._values[name] = values
+        return values
+
+    def present(self, *names):
+        """Ordinals of the games with none of the named columns NULL"""
+        mask = np.ones(self.count, dtype=bool)
+        for name in names:
+            mask &= ~np.isnan(self.values(name))
+        return np.flatnonzero(mask)
+
+    def column(self, name, ordinals):
+        """Values of one column for `ordinals` as the database returns them"""
+        if name in self.strings:
+            return self.strings[name].take(ordinals)
+        if name == 'id':
+            return (ordinals + 1).tolist()
+        if name == 'estimated_owners':
+            return [self.owner_names[code] for code in self.owner_codes[ordinals].tolist()]
+        values = self.values(name)[ordinals]
+        if name == 'release_date':
+            return [None if days != days else EPOCH + timedelta(days=days) for days in values.tolist()]
+        if name in self.numbers and np.issubdtype(self.numbers[name].dtype, np.floating):
+            return [None if value != value else value for value in values.tolist()]
+        return [None if value != value else int(value) for value in values.tolist()]
+
+    def rows(self, keys, ordinals=None):
+        """Rows of the named columns with attribute access, like a query result"""
+        ordinals = np.arange(self.count) if ordinals is None else np.asarray(ordinals, dtype=np.int64)
+        make = row_type(tuple(keys))._make
+        return [make(row) for row in zip(*(self.column(key, ordinals) for key in keys))]
+
+
+def game_details(game_id, game, release_date):
+    """A games.json entry rendered like the /api/game_details response"""
+    details = {name: game.get(name, default) for name, default in GAME_DEFAULTS.items()}
+    details['game_id'] = game_id
+    details['release_date'] = http_date(release_date) if release_date else None
+    for name in DETAIL_NAME_LISTS:
+        details[name] = unique(game.get(name) or [])
+    details['tags'] = dict(sorted(tag_votes(game), key=lambda item: (item[1] is None, -(item[1] or 0), item[0])))
+    details['packages'] = [package_columns(package) for package in game.get('packages') or []]
+    # Same encoding as Flask's default JSON provider
+    return json.dumps(details, ensure_ascii=True, sort_keys=True)
+
+
+class StoreBuilder:
+    """Accumulates games.json entries and packs them into a ColumnStore"""
+
+    def __init__(self):
+        self.numbers = {name: [] for name in NUMERIC_COLUMNS}
+        self.strings = {name: [] for name in STRING_COLUMNS}
+        self.owners = []
+        self.links = {facet: ([0], [], []) for facet in FACETS}
+        self.interned = {facet: {} for facet in FACETS}
+        self.owner_codes = {}
+
+    def add(self, game_id, game):
+        release_date = parse_date(game.get('release_date', ''))
+        numbers = {
+            'price': game.get('price', GAME_DEFAULTS['price']),
+            'peak_ccu': game.get('peak_ccu', GAME_DEFAULTS['peak_ccu']),
+            'release_year': release_date.year if release_date else None,
+            'release_date': (release_date - EPOCH).days if release_date else None,
+            'review_ratio': review_ratio(game.get('positive', 0), game.get('negative', 0)),
+        }
+        for name, value in numbers.items():
+            self.numbers[name].append(value)
+
+        self.strings['game_id'].append(game_id)
+        for name in ('name', 'header_image', 'short_description'):
+            self.strings[name].append(game.get(name) or '')
+        self.strings['details'].append(game_details(game_id, game, release_date))
+        owners = game.get('estimated_owners') or ''
+        self.owners.append(self.owner_codes.setdefault(owners, len(self.owner_codes)))
+
+        for facet, key in FACETS.items():
+            values = game.get(key) or []
+            pairs = values.items() if isinstance(values, dict) else ((name, None) for name in values)
+            offsets, codes, votes = self.links[facet]
+            interned = self.interned[facet]
+            for name, count in dict(pairs).items():
+                codes.append(interned.setdefault(name, len(interned)))
+                votes.append(count)
+            offsets.append(len(codes))
+
+    def build(self, version):
+        numbers = {}
+        for name, dtype in NUMERIC_COLUMNS.items():
+            null = null_value(dtype)
+            numbers[name] = np.array([null if value is None else value for value in self.numbers[name]], dtype=dtype)
+        strings = {name: StringColumn.pack(values) for name, values in self.strings.items()}
+
+        memberships = {}
+        for facet, (offsets, codes, votes) in self.links.items():
+            null = null_value(np.int32)
+            memberships[facet] = Membership(
+                list(self.interned[facet]),
+                np.array(offsets, dtype=np.int64),
+                np.array(codes, dtype=np.int32),
+                np.array([null if count is None else count for count in votes], dtype=np.int32)
+                if facet == 'tag' else None,
+            )
+        return ColumnStore(
+            version, numbers, strings, np.array(self.owners, dtype=np.uint16), list(self.owner_codes), memberships,
+        )
+
+
+def chunk_paths(directory):
+    """The non-empty chunk_<n>.json files of a directory in chunk order"""
+    paths = []
+    for name in os.listdir(directory):
+        match = CHUNK_FILE.fullmatch(name)
+        path = os.path.join(directory, name)
+        if match and os.path.getsize(path) > 0:
+            paths.append((int(match.group(1)), path))
+    return [path for _, path in sorted(paths)]
+
+
+def chunks_version(paths):
+    """Digest of the chunk files' names, sizes and modification times"""
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f'{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()
+
+
+def load_chunks(directory):
+    """
+    Build a ColumnStore from the chunk_<n>.json files written by
+    script/analyze_and_merge_data.py, one chunk in memory at a time.
+    """
+    paths = chunk_paths(directory)
+    if not paths:
+        raise FileNotFoundError(f"No chunk_<n>.json files in {directory}")
+    builder = StoreBuilder()
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            for game_id, game in json.load(file).items():
+                builder.add(game_id, game)
+    return builder.build(chunks_version(paths))
+
+
+class MemoryDataset:
+    """
+    The ColumnStore served from when DATA_SOURCE is 'memory', loaded once by
+    init_app: mapped from DATA_SNAPSHOT_PATH when that snapshot is there and
+    not older than the chunk files next to it, otherwise parsed from the chunks.
+    """
+
+    def __init__(self):
+        self.store = None
+
+    def init_app(self, app):
+        source = app.config['DATA_SOURCE']
+        if source not in DATA_SOURCES:
+            raise ValueError(f"DATA_SOURCE must be one of {', '.join(DATA_SOURCES)}, got {source!r}")
+        if source == 'memory':
+            self.store = self.load(app.config['DATA_SNAPSHOT_PATH'], app.config['DATA_CHUNK_DIR'])
+
+    @staticmethod
+    def load(snapshot_path, chunk_dir):
+        from .snapshot import load_snapshot, snapshot_version
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            paths = chunk_paths(chunk_dir) if os.path.isdir(chunk_dir) else []
+            if not paths or chunks_version(paths) == snapshot_version(snapshot_path):
+                return load_snapshot(snapshot_path)
+            log.warning("Snapshot %s is not of the current chunk files, loading the chunks instead", snapshot_path)
+        return load_chunks(chunk_dir)
+
+    def get(self):
+        return self.store
+
+
+memory_dataset = MemoryDataset()
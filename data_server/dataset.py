@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .columnstore import memory_dataset
+from .models import DatasetMeta
+
+log = logging.getLogger(__name__)
+
+VERSION_KEY = 'version'
+UNVERSIONED = 'unversioned'
+
+_lock = threading.Lock()
+_version = None
+_checked_at = 0.0
+
+
+def current_version():
+    """
+    Version of the loaded dataset, as recorded by the loader in dataset_meta.
+
+    The value is re-read at most every DATASET_VERSION_CHECK_SECONDS so hot
+    requests do not pay a query for it. In memory mode it is the version of
+    the column store.
+    """
+    global _version, _checked_at
+    store = memory_dataset.get()
+    if store is not None:
+        return store.version
+    interval = current_app.config['DATASET_VERSION_CHECK_SECONDS']
+    with _lock:
+        if _version is not None and time.monotonic() - _checked_at < interval:
+            return _version
+
+    version = db.session.execute(
+        select(DatasetMeta.value).where(DatasetMeta.key == VERSION_KEY)
+    ).scalar() or UNVERSIONED
+
+    with _lock:
+        _version, _checked_at = version, time.monotonic()
+    return version
+
+
+def forget_version():
+    """Make the next current_version() call read the database again"""
+    global _version
+    with _lock:
+        _version = None
+
+
+def bump_version():
+    """
+    Record a new dataset version, as the loader does after a load. Every
+    server process picks it up within DATASET_VERSION_CHECK_SECONDS and drops
+    what it cached for the previous one.
+    """
+    table = DatasetMeta.__table__
+    db.session.execute(delete(table).where(table.c.key == VERSION_KEY))
+    db.session.execute(insert(table).values(key=VERSION_KEY, value=uuid.uuid4().hex, updated_at=datetime.now()))
+    db.session.commit()
+    forget_version()
+
+
+class VersionedIndex:
+    """
+    An in-memory structure built from the dataset on first use and rebuilt
+    whenever the dataset version changes. `build` runs inside the request that
+    first needs it; concurrent requests wait for that build instead of
+    repeating it, and `warm_up` builds every index ahead of time.
+    """
+
+    instances = []
+
+    def __init__(self, build):
+        self.build = build
+        self.version = None
+        self.value = None
+        self.lock = threading.Lock()
+        VersionedIndex.instances.append(self)
+
+    def get(self):
+        version = current_version()
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    self.value = self.build()
+                    self.version = version
+        return self.value
+
+
+def warm_up(app):
+    """
+    Build every VersionedIndex and the column store's derived arrays for the
+    current dataset version, so processes forked afterwards start warm and
+    share them copy-on-write. With the database unreachable the indexes are
+    left to be built on first use.
+    """
+    with app.app_context():
+        store = memory_dataset.get()
+        if store is not None:
+            store.warm()
+        try:
+            for index in VersionedIndex.instances:
+                index.get()
+        except SQLAlchemyError:
+            log.exception("Building the in-memory indexes failed, they are built on first use instead")
+        finally:
+            db.session.remove()
+            # Connections must not be shared with forked processes
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+def reload_dataset(app):
+    """Load the current dataset again (memory mode) and warm everything up for it"""
+    if memory_dataset.get() is not None:
+        memory_dataset.init_app(app)
+    forget_version()
+    warm_up(app)
@@ -0,0 +1,246 @@
+"""
+Local store of Steam review histograms.
+
+Histograms live in review_histograms / review_rollups and are served from
+there, so Steam is only asked for games that were never fetched. A
+HistogramPrefetcher thread keeps the top REVIEW_PREFETCH_TOP_N games by
+peak_ccu fresh, refetches stored histograms older than REVIEW_HISTOGRAM_MAX_AGE
+when they are requested, and sends Steam at most REVIEW_PREFETCH_RATE requests
+per second. With several server processes only the one holding
+REVIEW_PREFETCH_LOCK_FILE runs the top-N cycle.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .models import Game, ReviewHistogram, ReviewRollup
+from .upstream import review_histograms
+
+try:
+    import fcntl
+except ImportError:  # no file locks on Windows, where only the development server runs
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+SERIES = ('rollups', 'recent')
+
+
+def utcnow():
+    # Stored naive, in UTC, so it can go straight into Last-Modified
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def load_histogram(game_id):
+    """The stored histogram of a game in the upstream response shape and when it was fetched, or None"""
+    header = db.session.get(ReviewHistogram, game_id)
+    if header is None:
+        return None
+
+    results = {
+        'start_date': header.start_date,
+        'end_date': header.end_date,
+        'weeks': [],
+        'rollup_type': header.rollup_type,
+        'rollups': [],
+        'recent': [],
+    }
+    points = db.session.execute(
+        select(ReviewRollup.series, ReviewRollup.date, ReviewRollup.recommendations_up,
+               ReviewRollup.recommendations_down)
+        .where(ReviewRollup.game_id == game_id)
+        .order_by(ReviewRollup.series, ReviewRollup.date)
+    )
+    for series, date, up, down in points:
+        results[series].append({'date': date, 'recommendations_up': up, 'recommendations_down': down})
+
+    histogram = {
+        'success': 1,
+        'results': results,
+        'count_all_reviews': header.count_all_reviews,
+        'expand_graph': header.expand_graph,
+    }
+    return histogram, header.fetched_at
+
+
+def save_histogram(game_id, histogram):
+    """Replace the stored histogram of a game with an upstream response; returns the fetch time"""
+    fetched_at = utcnow()
+    if histogram.get('success') != 1:
+        return fetched_at
+
+    results = histogram.get('results') or {}
+    points = {}
+    for series in SERIES:
+        for point in results.get(series) or []:
+            points[series, point['date']] = {
+                'game_id': game_id,
+                'series': series,
+                'date': point['date'],
+                'recommendations_up': point.get('recommendations_up'),
+                'recommendations_down': point.get('recommendations_down'),
+            }
+
+    db.session.execute(delete(ReviewRollup).where(ReviewRollup.game_id == game_id))
+    db.session.merge(ReviewHistogram(
+        game_id=game_id,
+        start_date=results.get('start_date'),
+        end_date=results.get('end_date'),
+        rollup_type=results.get('rollup_type'),
+        count_all_reviews=histogram.get('count_all_reviews'),
+        expand_graph=histogram.get('expand_graph'),
+        fetched_at=fetched_at,
+    ))
+    if points:
+        db.session.execute(insert(ReviewRollup), list(points.values()))
+    db.session.commit()
+    return fetched_at
+
+
+class HistogramPrefetcher:
+    """Background thread that fetches review histograms into the store, rate limited"""
+
+    def __init__(self):
+        self.app = None
+        self.thread = None
+        self.requested = set()
+        self.condition = threading.Condition()
+        self.not_before = 0.0
+        self.fetched = 0
+        self.failed = 0
+        self.lock_file = None
+
+    def init_app(self, app):
+        config = app.config
+        self.app = app
+        self.max_age = timedelta(seconds=config['REVIEW_HISTOGRAM_MAX_AGE'])
+        self.top_n = config['REVIEW_PREFETCH_TOP_N']
+        self.interval = config['REVIEW_PREFETCH_INTERVAL']
+        rate = config['REVIEW_PREFETCH_RATE']
+        # A rate of zero (or less) allows no requests at all, which disables prefetching
+        self.min_delay = 1 / rate if rate > 0 else None
+        self.lock_path = config['REVIEW_PREFETCH_LOCK_FILE']
+        # The store is a database table, so there is nothing to prefetch into in memory mode
+        if config['REVIEW_PREFETCH_ENABLED'] and rate > 0 and config['DATA_SOURCE'] == 'database':
+            # Started by the first request, so the reloader's parent process never runs it
+            app.before_request(self.start)
+
+    def start(self):
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='histogram-prefetch', daemon=True)
+                self.thread.start()
+
+    def holds_lock(self):
+        """Whether this process runs the top-N cycle; the lock is kept until the process exits"""
+        if fcntl is None or not self.lock_path:
+            return True
+        if self.lock_file is None:
+            lock_file = open(self.lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self.lock_file = lock_file
+        return True
+
+    def is_stale(self, fetched_at):
+        return utcnow() - fetched_at > self.max_age
+
+    def request_refresh(self, game_id):
+        with self.condition:
+            self.requested.add(game_id)
+            self.condition.notify()
+
+    def take_requested(self):
+        with self.condition:
+            requested, self.requested = self.requested, set()
+        return requested
+
+    def due_games(self):
+        """Top games by peak_ccu whose stored histogram is missing or too old"""
+        top = (
+            select(Game.game_id, Game.peak_ccu)
+            .where(Game.peak_ccu.is_not(None))
+            .order_by(Game.peak_ccu.desc())
+            .limit(self.top_n)
+            .subquery()
+        )
+        query = (
+            select(top.c.game_id)
+            .outerjoin(ReviewHistogram, ReviewHistogram.game_id == top.c.game_id)
+            .where(or_(ReviewHistogram.fetched_at.is_(None), ReviewHistogram.fetched_at < utcnow() - self.max_age))
+            .order_by(top.c.peak_ccu.desc())
+        )
+        return db.session.execute(query).scalars().all()
+
+    def throttle(self):
+        delay = self.not_before - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.not_before = time.monotonic() + self.min_delay
+
+    def fetch(self, game_id):
+        self.throttle()
+        try:
+            save_histogram(game_id, review_histograms.fetch(game_id))
+            self.fetched += 1
+        except requests.HTTPError as error:
+            self.failed += 1
+            if error.response.status_code in (429, 503):
+                retry_after = error.response.headers.get('Retry-After', '')
+                self.not_before = time.monotonic() + (int(retry_after) if retry_after.isdigit() else 60)
+            log.warning("Fetching review histogram for %s failed: %s", game_id, error)
+        except requests.RequestException as error:
+            self.failed += 1
+            log.warning("Fetching review histogram for %s failed: %s", game_id, error)
+
+    def refresh(self, game_ids):
+        for game_id in game_ids:
+            # Games someone is looking at right now go first
+            for requested in self.take_requested():
+                self.fetch(requested)
+            self.fetch(game_id)
+
+    def run(self):
+        next_cycle = 0.0
+        while True:
+            with self.condition:
+                while not self.requested and time.monotonic() < next_cycle:
+                    self.condition.wait(next_cycle - time.monotonic())
+
+            with self.app.app_context():
+                try:
+                    self.refresh(self.take_requested())
+                    if time.monotonic() >= next_cycle:
+                        # Other processes still refresh what their own requests found stale
+                        if self.holds_lock():
+                            self.refresh(self.due_games())
+                        next_cycle = time.monotonic() + self.interval
+                except SQLAlchemyError:
+                    log.exception("Review histogram prefetch failed")
+                    db.session.rollback()
+                    next_cycle = time.monotonic() + self.interval
+                finally:
+                    db.session.remove()
+
+    def stats(self):
+        with self.condition:
+            queued = len(self.requested)
+        return {
+            'running': self.thread is not None,
+            'holds_lock': self.lock_file is not None,
+            'queued': queued,
+            'fetched': self.fetched,
+            'failed': self.failed,
+        }
+
+
+histogram_prefetcher = HistogramPrefetcher()
@@ -0,0 +1,154 @@
+"""
+Level-of-detail sampling for the (price, peak_ccu) scatter plot.
+
+Per scale type the points are mapped to the unit square in scale space and
+sorted by their Morton (Z-order) code on a 2^MAX_LEVEL grid. The cell of a
+point on any coarser level is a prefix of that code, so one sorted array
+serves as a grid at every resolution: a viewport query masks the points on
+screen and finds the cells by comparing neighbouring codes. Sparse cells come
+back as individual points, dense cells as one bin carrying its point count.
+"""
+import math
+
+import numpy as np
+from sqlalchemy import select
+
+from . import db
+from .columnstore import memory_dataset
+from .dataset import VersionedIndex
+from .models import Game
+
+MAX_LEVEL = 16
+SCALES = ('linear', 'symlog')
+
+POINT_COLUMNS = (Game.game_id, Game.name, Game.price, Game.peak_ccu, Game.estimated_owners, Game.release_year)
+POINT_KEYS = [column.key for column in POINT_COLUMNS]
+
+
+def symlog(values):
+    # d3.scaleSymlog with its default constant of 1
+    return np.sign(values) * np.log1p(np.abs(values))
+
+
+def symlog_inverse(values):
+    return np.sign(values) * np.expm1(np.abs(values))
+
+
+# scale type -> (data to scale space, scale space to data)
+TRANSFORMS = {
+    'linear': (np.asarray, np.asarray),
+    'symlog': (symlog, symlog_inverse),
+}
+
+
+def spread_bits(values):
+    """Move bit i of each 16-bit value to bit 2i"""
+    values = values.astype(np.uint64)
+    values = (values | (values << 8)) & 0x00FF00FF
+    values = (values | (values << 4)) & 0x0F0F0F0F
+    values = (values | (values << 2)) & 0x33333333
+    values = (values | (values << 1)) & 0x55555555
+    return values
+
+
+def morton_codes(cell_x, cell_y):
+    return spread_bits(cell_x) | (spread_bits(cell_y) << 1)
+
+
+class ScaleGrid:
+    """Points of one scale type in Morton order, with their scale-space coordinates"""
+
+    def __init__(self, price, peak_ccu, scale):
+        self.forward, self.inverse = TRANSFORMS[scale]
+        x = self.forward(price)
+        y = self.forward(peak_ccu)
+        self.x_min, self.y_min = (x.min(), y.min()) if len(x) else (0.0, 0.0)
+        self.x_span = max(x.max() - self.x_min, 1e-9) if len(x) else 1.0
+        self.y_span = max(y.max() - self.y_min, 1e-9) if len(y) else 1.0
+
+        cells = 1 << MAX_LEVEL
+        cell_x = np.clip(((x - self.x_min) / self.x_span * cells).astype(np.int64), 0, cells - 1)
+        cell_y = np.clip(((y - self.y_min) / self.y_span * cells).astype(np.int64), 0, cells - 1)
+        codes = morton_codes(cell_x, cell_y)
+
+        order = np.argsort(codes, kind='stable')
+        self.codes = codes[order]
+        self.x = x[order]
+        self.y = y[order]
+        self.rows = order
+
+    def level_for(self, x_range, y_range, width, height, cell_pixels):
+        """Coarsest level whose cells are at most `cell_pixels` wide on screen"""
+        wanted = 1.0
+        for span, view, pixels in ((self.x_span, x_range, width), (self.y_span, y_range, height)):
+            if view > 0:
+                wanted = max(wanted, pixels / cell_pixels * span / view)
+        return min(MAX_LEVEL, max(0, math.ceil(math.log2(wanted))))
+
+    def query(self, viewport, width, height, cell_pixels, threshold):
+        """
+        Points and bins inside `viewport` = (x_min, x_max, y_min, y_max) in data
+        units, any of which may be None for an open side.
+        """
+        x_min, x_max, y_min, y_max = (
+            None if value is None else float(self.forward(np.float64(value))) for value in viewport
+        )
+        x_min = self.x_min if x_min is None else x_min
+        x_max = self.x_min + self.x_span if x_max is None else x_max
+        y_min = self.y_min if y_min is None else y_min
+        y_max = self.y_min + self.y_span if y_max is None else y_max
+
+        visible = np.flatnonzero((self.x >= x_min) & (self.x <= x_max) & (self.y >= y_min) & (self.y <= y_max))
+        level = self.level_for(x_max - x_min, y_max - y_min, width, height, cell_pixels)
+
+        # Masking keeps the Morton order, so every cell is a run of equal prefixes
+        cells = self.codes[visible] >> np.uint64(2 * (MAX_LEVEL - level))
+        boundaries = np.ones(len(cells), dtype=bool)
+        boundaries[1:] = cells[1:] != cells[:-1]
+        starts = np.flatnonzero(boundaries)
+        counts = np.diff(np.append(starts, len(cells)))
+
+        point_rows = self.rows[visible[np.repeat(counts <= threshold, counts)]]
+
+        dense = counts > threshold
+        bins = {'count': counts[dense]}
+        for name, values in (('price', self.x[visible]), ('peak_ccu', self.y[visible])):
+            if len(starts):
+                # Bins sit at their centroid in scale space, where they are drawn
+                bins[name] = self.inverse(np.add.reduceat(values, starts)[dense] / counts[dense])
+                bins[f'{name}_min'] = self.inverse(np.minimum.reduceat(values, starts)[dense])
+                bins[f'{name}_max'] = self.inverse(np.maximum.reduceat(values, starts)[dense])
+            else:
+                bins[name] = bins[f'{name}_min'] = bins[f'{name}_max'] = values
+        return level, len(visible), point_rows, bins
+
+
+class LodIndex:
+    def __init__(self, rows):
+        self.rows = rows
+        price = np.array([row.price for row in rows], dtype=np.float64)
+        peak_ccu = np.array([row.peak_ccu for row in rows], dtype=np.float64)
+        self.grids = {scale: ScaleGrid(price, peak_ccu, scale) for scale in SCALES}
+
+    def sample(self, scale, viewport, width, height, cell_pixels, threshold):
+        level, total, point_rows, bins = self.grids[scale].query(viewport, width, height, cell_pixels, threshold)
+        keys = ('price', 'peak_ccu', 'count', 'price_min', 'price_max', 'peak_ccu_min', 'peak_ccu_max')
+        columns = [np.asarray(bins[key]).tolist() for key in keys]
+        return {
+            'scale': scale,
+            'level': level,
+            'total': total,
+            'points': [dict(zip(POINT_KEYS, self.rows[index])) for index in point_rows.tolist()],
+            'bins': [dict(zip(keys, values)) for values in zip(*columns)],
+        }
+
+
+def build_lod_index():
+    store = memory_dataset.get()
+    if store is not None:
+        return LodIndex(store.rows(POINT_KEYS, store.present('price', 'peak_ccu')))
+    query = select(*POINT_COLUMNS).where(Game.price.is_not(None), Game.peak_ccu.is_not(None))
+    return LodIndex(db.session.execute(query).all())
+
+
+lod_index = VersionedIndex(build_lod_index)
@@ -0,0 +1,168 @@
+"""
+Read queries answered from the in-memory ColumnStore (DATA_SOURCE = 'memory').
+
+Every function mirrors the SQL an endpoint runs in database mode with
+vectorised NumPy filtering and returns rows shaped like that query's result,
+so the routes render both the same way.
+"""
+import numpy as np
+
+from .queries import (
+    FACET_RANGE_FILTERS, MEMBERSHIP_FILTERS, RANGE_FILTERS, choice_arg, decode_cursor, number_arg,
+    owners_bucket, page_args,
+)
+from .timeline import group_codes
+
+
+def range_mask(store, args, filters):
+    mask = np.ones(store.count, dtype=bool)
+    for prefix, column, parse in filters:
+        values = store.values(column.key)
+        low = number_arg(args, f'{prefix}_min', parse)
+        high = number_arg(args, f'{prefix}_max', parse)
+        # NaN fails both comparisons, so NULLs drop out like in SQL
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+    return mask
+
+
+def owners_mask(store, args):
+    owners = {owners_bucket(value) for value in args.getlist('owners')}
+    if not owners:
+        return np.ones(store.count, dtype=bool)
+    bounds = store.owner_bounds()
+    # Match against the interned buckets, then select games by bucket code
+    codes = [code for code, (low, high) in enumerate(bounds.tolist()) if (low, high) in owners]
+    return np.isin(store.owner_codes, codes)
+
+
+def scatter_mask(store, args):
+    """Mask of the games passing the filters of queries.scatter_filters"""
+    mask = range_mask(store, args, RANGE_FILTERS) & owners_mask(store, args)
+    for param, *_ in MEMBERSHIP_FILTERS:
+        names = args.getlist(param)
+        mode = choice_arg(args, f'{param}_mode', ('any', 'all'), 'any')
+        if names:
+            mask &= store.memberships[param].having(names, mode)
+    return mask
+
+
+def facet_mask(store, args):
+    """Mask of the games passing the filters of queries.facet_filters"""
+    return range_mask(store, args, FACET_RANGE_FILTERS) & owners_mask(store, args)
+
+
+def scatter_rows(store, keys, args):
+    """
+    Scatter-plot rows in keyset order as queries.paginate returns them, with
+    the sort value and primary key as the last two columns, and the page size.
+    """
+    sort, descending, limit, cursor = page_args(args)
+    mask = scatter_mask(store, args)
+    keys_of_sort = store.values(sort)
+    nulls = np.isnan(keys_of_sort)
+
+    if cursor:
+        sort_value, game_pk = decode_cursor(cursor)
+        pks = store.values('id')
+        after = pks < game_pk if descending else pks > game_pk
+        if sort_value is None:
+            mask &= (nulls & after) if descending else (nulls & after) | ~nulls
+        elif descending:
+            mask &= (keys_of_sort < sort_value) | ((keys_of_sort == sort_value) & after) | nulls
+        else:
+            mask &= (keys_of_sort > sort_value) | ((keys_of_sort == sort_value) & after)
+
+    ordinals = np.flatnonzero(mask)
+    if sort != 'id':
+        # NULLs first, as the index orders them; reversed below for descending
+        ordinals = ordinals[np.lexsort((ordinals, keys_of_sort[ordinals], ~nulls[ordinals]))]
+    if descending:
+        ordinals = ordinals[::-1]
+    if limit is not None:
+        ordinals = ordinals[:limit]
+    return store.rows(list(keys) + [sort, 'id'], ordinals), limit
+
+
+def name_lists(store, facet, ordinals):
+    """The sorted `facet` names of the game at each of `ordinals`, as backends.DatabaseBackend.name_lists"""
+    membership = store.memberships[facet]
+    names = list(membership.names)
+    codes = membership.codes.tolist()
+    starts = membership.offsets[ordinals].tolist()
+    ends = membership.offsets[ordinals + 1].tolist()
+    return [sorted(names[code] for code in codes[start:end]) for start, end in zip(starts, ends)]
+
+
+def timeline_columns(store, bucket, group_by, args):
+    """The histograms of timeline.timeline_columns for the matching games, each counted once"""
+    release = 'release_year' if bucket == 'year' else 'release_date'
+    mask = scatter_mask(store, args) & ~np.isnan(store.values(release))
+    if group_by == 'genre':
+        genres = store.memberships['genre']
+        ordinals, codes = genres.links(mask)
+        group_values = (np.array(genres.names, dtype=object)[codes],)
+    else:
+        ordinals = np.flatnonzero(mask)
+        group_values = ()
+        if group_by == 'owners':
+            group_values = (store.values('owners_low')[ordinals], store.values('owners_high')[ordinals])
+
+    when = store.values(release)[ordinals].astype(np.int64)
+    if bucket == 'month':
+        # Days since 1970-01-01 to months since year 0, as the SQL computes them
+        when = when.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) + 1970 * 12
+    groups, names = group_codes(group_by, len(ordinals), *group_values)
+    games = np.ones(len(ordinals), dtype=np.int64)
+    return (
+        names,
+        (when, groups, store.values('price')[ordinals], games),
+        (when, groups, store.values('peak_ccu')[ordinals], games),
+    )
+
+
+def facet_totals(store, facet, mask):
+    """(name, game count, peak_ccu sum, peak_ccu count) per name of a facet over the games in `mask`"""
+    membership = store.memberships[facet]
+    ordinals, codes = membership.links(mask)
+    peak_ccu = store.values('peak_ccu')[ordinals]
+    known = ~np.isnan(peak_ccu)
+    size = len(membership.names)
+    counts = np.bincount(codes, minlength=size).tolist()
+    ccu_sums = np.bincount(codes[known], weights=peak_ccu[known], minlength=size).tolist()
+    ccu_counts = np.bincount(codes[known], minlength=size).tolist()
+    return [
+        (name, count, ccu_sum, ccu_count)
+        for name, count, ccu_sum, ccu_count in zip(membership.names, counts, ccu_sums, ccu_counts)
+        if count
+    ]
+
+
+def similar_games(store, ordinal, keys, limit):
+    """
+    The `limit` games whose tag profile is closest to the game at `ordinal`,
+    as rows of `keys` plus the score. Cosine similarity over the same TF-IDF
+    weights as create_database/similarity.py, but scored for this one game
+    from the games sharing each of its tags.
+    """
+    tags = store.memberships['tag']
+    weights = tags.weights
+    order, starts = tags.by_name
+    start, end = tags.offsets[ordinal], tags.offsets[ordinal + 1]
+
+    games, products = [], []
+    for code, weight in zip(tags.codes[start:end].tolist(), weights[start:end].tolist()):
+        links = order[starts[code]:starts[code + 1]]
+        games.append(tags.link_games[links])
+        products.append(weight * weights[links])
+    if not games:
+        return []
+    scores = np.bincount(np.concatenate(games), weights=np.concatenate(products), minlength=store.count)
+    scores[ordinal] = 0  # a game is not its own neighbour
+
+    candidates = np.flatnonzero(scores > 0)
+    best = candidates[np.argsort(-scores[candidates], kind='stable')[:limit]]
+    # Rounded to float32 like the scores the loader stores
+    return [row + (score,) for row, score in zip(store.rows(keys, best), scores[best].astype(np.float32).tolist())]
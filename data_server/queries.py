@@ -0,0 +1,223 @@
+import base64
+import binascii
+import json
+import math
+
+from sqlalchemy import and_, func, or_, select
+
+from create_database.transform import name_key, price_band
+from .models import Game, Category, FacetAggregate, Genre, game_category, game_genre
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# Keyset sort keys; every one is indexed and ties are broken on the primary key.
+# NULLs take the place the index gives them: first ascending, last descending.
+SORT_COLUMNS = {
+    'id': Game.id,
+    'peak_ccu': Game.peak_ccu,
+    'price': Game.price,
+    'release_year': Game.release_year,
+}
+
+# (query parameter prefix, column, parser) for the `<prefix>_min` / `<prefix>_max` filters
+RANGE_FILTERS = (
+    ('year', Game.release_year, int),
+    ('price', Game.price, float),
+    ('peak_ccu', Game.peak_ccu, int),
+)
+
+
+def price_band_arg(value):
+    """Parse a price bound as the lower edge of its price band"""
+    price = float(value)
+    if not math.isfinite(price):
+        raise ValueError(value)
+    return price_band(price)
+
+
+# The same filters over the precomputed facet_aggregates cells. Prices match
+# by band: a price range selects every band it overlaps.
+FACET_RANGE_FILTERS = (
+    ('year', FacetAggregate.release_year, int),
+    ('price', FacetAggregate.price_band, price_band_arg),
+)
+
+# (repeatable query parameter, dimension model, association table, association column)
+MEMBERSHIP_FILTERS = (
+    ('category', Category, game_category, 'category_id'),
+    ('genre', Genre, game_genre, 'genre_id'),
+)
+
+
+class InvalidParameter(ValueError):
+    pass
+
+
+def number_arg(args, name, parse=float):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        number = parse(value)
+    except ValueError:
+        raise InvalidParameter(f"'{name}' must be a number, got {value!r}")
+    if not math.isfinite(number):
+        raise InvalidParameter(f"'{name}' must be a finite number, got {value!r}")
+    return number
+
+
+def choice_arg(args, name, choices, default):
+    value = args.get(name, default)
+    if value not in choices:
+        raise InvalidParameter(f"'{name}' must be one of {', '.join(choices)}, got {value!r}")
+    return value
+
+
+def owners_bucket(value):
+    """Parse an owners bucket given as its estimated_owners range, e.g. "20000-50000" """
+    try:
+        low, high = value.split('-')
+        return int(low.strip()), int(high.strip())
+    except ValueError:
+        raise InvalidParameter(f"'owners' must be an owners range such as 20000-50000, got {value!r}")
+
+
+def membership_condition(model, table, column, names, mode):
+    """Games linked to any (or all) of the given dimension names"""
+    game_ids = (
+        select(table.c.game_id)
+        .join(model, table.c[column] == model.id)
+        .where(model.name.in_(names))
+    )
+    if mode == 'all':
+        # The collation matches spellings that differ in case or accents to one row
+        game_ids = game_ids.group_by(table.c.game_id).having(func.count() == len({name_key(name) for name in names}))
+    return Game.id.in_(game_ids)
+
+
+def range_conditions(args, filters):
+    conditions = []
+    for prefix, column, parse in filters:
+        low = number_arg(args, f'{prefix}_min', parse)
+        high = number_arg(args, f'{prefix}_max', parse)
+        if low is not None:
+            conditions.append(column >= low)
+        if high is not None:
+            conditions.append(column <= high)
+    return conditions
+
+
+def owners_conditions(args, low_column, high_column):
+    owners = [owners_bucket(value) for value in args.getlist('owners')]
+    if not owners:
+        return []
+    return [or_(*(and_(low_column == low, high_column == high) for low, high in owners))]
+
+
+def scatter_filters(args):
+    """
+    SQL conditions for the scatter-plot filters in the request arguments.
+
+    `year_min`/`year_max`, `price_min`/`price_max` and `peak_ccu_min`/`peak_ccu_max`
+    are inclusive ranges, `owners` (repeatable) selects owner buckets by their
+    range (`owners=20000-50000`), and `category`/`genre` (repeatable) match any
+    of the names, or all of them with `category_mode=all`/`genre_mode=all`.
+    """
+    conditions = range_conditions(args, RANGE_FILTERS)
+    conditions += owners_conditions(args, Game.owners_low, Game.owners_high)
+
+    for param, model, table, column in MEMBERSHIP_FILTERS:
+        names = args.getlist(param)
+        mode = choice_arg(args, f'{param}_mode', ('any', 'all'), 'any')
+        if names:
+            conditions.append(membership_condition(model, table, column, names, mode))
+
+    return conditions
+
+
+def facet_filters(args):
+    """Conditions on facet_aggregates for the year, price and owners filters of `scatter_filters`"""
+    conditions = range_conditions(args, FACET_RANGE_FILTERS)
+    conditions += owners_conditions(args, FacetAggregate.owners_low, FacetAggregate.owners_high)
+    return conditions
+
+
+def encode_cursor(sort_value, game_pk):
+    payload = json.dumps([sort_value, game_pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(sort value, primary key) of a cursor; the sort value is None past the last non-NULL one"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, game_pk = json.loads(payload)
+        game_pk = int(game_pk)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidParameter("'cursor' is not a cursor returned by this endpoint")
+    valid = sort_value is None or (
+        isinstance(sort_value, (int, float)) and not isinstance(sort_value, bool) and math.isfinite(sort_value)
+    )
+    if not valid:
+        raise InvalidParameter("'cursor' is not a cursor returned by this endpoint")
+    return sort_value, game_pk
+
+
+def page_args(args):
+    """The `sort`, `order` (as descending), `limit` and `cursor` pagination arguments"""
+    sort = choice_arg(args, 'sort', tuple(SORT_COLUMNS), 'id')
+    descending = choice_arg(args, 'order', ('asc', 'desc'), 'asc') == 'desc'
+    limit = number_arg(args, 'limit', int)
+    cursor = args.get('cursor')
+    if cursor and limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidParameter(f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+    return sort, descending, limit, cursor
+
+
+def paginate(query, args):
+    """
+    Apply keyset pagination to a scatter-plot query.
+
+    The sort column and Game.id are appended as the last two selected columns
+    so the caller can build the next cursor from the final row. Returns the
+    query and the page size, which is None when the whole result is wanted.
+    """
+    sort, descending, limit, cursor = page_args(args)
+    column = SORT_COLUMNS[sort]
+
+    query = query.add_columns(column, Game.id)
+
+    if cursor:
+        sort_value, game_pk = decode_cursor(cursor)
+        if column is Game.id:
+            after = Game.id < game_pk if descending else Game.id > game_pk
+        elif sort_value is None:
+            # The cursor is within the NULLs, which come first ascending and last descending
+            after = and_(column.is_(None), Game.id < game_pk if descending else Game.id > game_pk)
+            if not descending:
+                after = or_(after, column.is_not(None))
+        elif descending:
+            after = or_(column < sort_value, and_(column == sort_value, Game.id < game_pk), column.is_(None))
+        else:
+            after = or_(column > sort_value, and_(column == sort_value, Game.id > game_pk))
+        query = query.where(after)
+
+    if descending:
+        query = query.order_by(column.desc(), Game.id.desc())
+    else:
+        query = query.order_by(column, Game.id)
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query, limit
+
+
+def next_cursor(rows, limit):
+    """Cursor for the page after `rows`, or None when this was the last page"""
+    if limit is None or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last[-2], last[-1])
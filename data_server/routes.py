@@ -1,111 +1,355 @@
+import hmac
+from datetime import timezone
+
 import requests
-from flask import jsonify, Blueprint, request
-from sqlalchemy.exc import OperationalError
+from flask import jsonify, Blueprint, request, Response, current_app, stream_with_context
+from sqlalchemy.exc import SQLAlchemyError
 
+from . import db
+from .backends import get_backend
+from .bitmaps import bitmap_index
+from .cache import cached_response, response_cache
+from .columnar import COLUMNAR_MIMETYPE, encode_columnar
+from .dataset import current_version
+from .histograms import histogram_prefetcher, load_histogram, save_histogram, utcnow
+from .lod import SCALES, lod_index
 from .models import Game
+from .queries import InvalidParameter, choice_arg, next_cursor, number_arg, page_args
+from .search import MAX_RESULTS as MAX_SEARCH_RESULTS, RESULT_KEYS as SEARCH_RESULT_KEYS, search_index
+from .spatial import ROW_KEYS, spatial_index
+from .timeline import BUCKETS, GROUPS, timeline_series
+from .upstream import review_histograms
 
 bp = Blueprint('main', __name__)
 
+# List endpoints select only the columns they return, so the large text and
+# JSON columns are never read and no ORM objects are built per row.
+SCATTER_PLOT_COLUMNS = (
+    Game.game_id, Game.name, Game.release_date, Game.price, Game.header_image, Game.peak_ccu,
+    Game.estimated_owners, Game.owners_low, Game.owners_high, Game.release_year, Game.review_ratio,
+)
+
+SCATTER_PLOT_KEYS = [column.key for column in SCATTER_PLOT_COLUMNS]
+
+# (key, facet) of the name lists the columnar scatter-plot response carries as well
+SCATTER_PLOT_NAME_LISTS = (('categories', 'category'), ('genres', 'genre'))
+
+SIMILAR_GAME_COLUMNS = (Game.game_id, Game.name, Game.header_image, Game.price, Game.peak_ccu)
+SIMILAR_GAME_KEYS = [column.key for column in SIMILAR_GAME_COLUMNS] + ['score']
+# Neighbours stored per game by the loader (create_database/similarity.py)
+SIMILAR_GAMES_LIMIT = 20
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Formats a list endpoint can answer in; JSON comes first so it wins for */*
+RESPONSE_FORMATS = {
+    'json': 'application/json',
+    'ndjson': NDJSON_MIMETYPE,
+    'columnar': COLUMNAR_MIMETYPE,
+}
+
+
+def requested_format():
+    """The `?format=` argument, otherwise the best match for the Accept header"""
+    name = request.args.get('format')
+    if name is not None:
+        if name not in RESPONSE_FORMATS:
+            raise InvalidParameter(f"'format' must be one of {', '.join(RESPONSE_FORMATS)}, got {name!r}")
+        return name
+    best = request.accept_mimetypes.best_match(list(RESPONSE_FORMATS.values()), 'application/json')
+    return next(name for name, mimetype in RESPONSE_FORMATS.items() if mimetype == best)
+
+
+def row_dicts(rows, keys):
+    # zip() stops at `keys`, dropping trailing bookkeeping columns such as the keyset ones
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def ndjson_response(rows, keys):
+    body = ''.join(current_app.json.dumps(row) + '\n' for row in row_dicts(rows, keys))
+    return Response(body, mimetype=NDJSON_MIMETYPE)
+
+
+def stream_ndjson(partitions, keys, total=None):
+    """
+    Stream rows as newline-delimited JSON, one row per line.
+
+    Each partition of rows is encoded as it arrives, so with the database
+    backend the first bytes go out before the query has been fully read and
+    memory stays flat. `total` is sent as X-Total-Count to let clients report
+    real progress.
+    """
+    def generate():
+        for partition in partitions:
+            yield ''.join(current_app.json.dumps(row) + '\n' for row in row_dicts(partition, keys))
+
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    if total is not None:
+        response.headers['X-Total-Count'] = str(total)
+    return response
+
+
+@bp.errorhandler(InvalidParameter)
+def invalid_parameter(error):
+    return jsonify({'error': str(error)}), 400
+
 
 @bp.route('/api/check_database', methods=['GET'])
 def check_database():
-    return jsonify({'status': 'offline'})
-
-    # TODO: Remove this after fixing the database
-    try:
-        Game.query.first()
-        return jsonify({'status': 'online'})
-    except OperationalError:
-        return jsonify({'status': 'offline'})
+    return jsonify({'status': get_backend().status()})
 
 
 @bp.route('/api/games_price_peak_ccu', methods=['GET'])
+@cached_response
 def get_games():
-    # TODO: Remove this limit
-    limit = request.args.get('limit')
-    if limit:
-        games = Game.query.limit(limit).all()
+    """
+    Scatter-plot rows, filtered in SQL (see queries.scatter_filters) or on the
+    column store in memory mode.
+
+    With `limit` or `cursor` the result is paged in keyset order (`sort`,
+    `order`); the cursor of the next page is returned in X-Next-Cursor.
+    """
+    backend = get_backend()
+    response_format = requested_format()
+    if response_format == 'ndjson' and page_args(request.args)[2] is None:
+        partitions, total = backend.scatter_partitions(SCATTER_PLOT_COLUMNS, request.args)
+        return stream_ndjson(partitions, SCATTER_PLOT_KEYS, total)
+
+    rows, limit = backend.scatter_rows(SCATTER_PLOT_COLUMNS, request.args)
+    if response_format == 'columnar':
+        name_lists = {key: backend.name_lists(facet, rows, request.args) for key, facet in SCATTER_PLOT_NAME_LISTS}
+        response = Response(encode_columnar(rows, SCATTER_PLOT_KEYS, name_lists=name_lists), mimetype=COLUMNAR_MIMETYPE)
+    elif response_format == 'ndjson':
+        response = ndjson_response(rows, SCATTER_PLOT_KEYS)
     else:
-        games = Game.query.all()
-    games_list = []
-    for game in games:
-        games_list.append({
-            'game_id': game.game_id,
-            'name': game.name,
-            'release_date': game.release_date,
-            'price': game.price,
-            'header_image': game.header_image,
-            'peak_ccu': game.peak_ccu,
-            'estimated_owners': game.estimated_owners,
-        })
-    return jsonify(games_list)
+        response = jsonify(row_dicts(rows, SCATTER_PLOT_KEYS))
+
+    cursor = next_cursor(rows, limit)
+    if cursor:
+        response.headers['X-Next-Cursor'] = cursor
+    return response
 
 
 @bp.route('/api/game_details/<game_id>', methods=['GET'])
 def get_game_details(game_id):
-    game = Game.query.filter_by(game_id=game_id).first()
-    if game:
-        return jsonify({
-            'game_id': game.game_id,
-            'name': game.name,
-            'release_date': game.release_date,
-            'price': game.price,
-            'header_image': game.header_image,
-            'peak_ccu': game.peak_ccu,
-            'estimated_owners': game.estimated_owners,
-            'developer': game.developer,
-            'publisher': game.publisher,
-            'genres': game.genres,
-            'tags': game.tags,
-            'categories': game.categories,
-            'description': game.description,
-            'about': game.about,
-            'short_description': game.short_description,
-            'reviews': game.reviews,
-            'languages': game.languages,
-            'system_requirements': game.system_requirements,
-            'platforms': game.platforms,
-            'website': game.website,
-            'background_image': game.background_image,
-            'screenshots': game.screenshots,
-            'movies': game.movies,
-            'demos': game.demos,
-            'dlc': game.dlc,
-            'packages': game.packages,
-            'metacritic': game.metacritic,
-            'recommendations': game.recommendations,
-            'achievements': game.achievements
-        })
+    """One game with its relations, shaped like a games.json entry"""
+    body = get_backend().game_details(game_id)
+    if body is None:
+        return jsonify({'error': f'Game {game_id} not found'}), 404
+    return Response(body, mimetype='application/json')
+
+
+@bp.route('/api/similar_games/<game_id>', methods=['GET'])
+@cached_response
+def get_similar_games(game_id):
+    """
+    Games with the most similar tag profile, best first, from the similar_games
+    table the loader precomputes (cosine similarity of TF-IDF weighted tag votes).
+    In memory mode the same scores are computed for the one game on request.
+    """
+    limit = number_arg(request.args, 'limit', int)
+    limit = SIMILAR_GAMES_LIMIT if limit is None else limit
+    if not 1 <= limit <= SIMILAR_GAMES_LIMIT:
+        raise InvalidParameter(f"'limit' must be between 1 and {SIMILAR_GAMES_LIMIT}")
+
+    rows = get_backend().similar_games(game_id, SIMILAR_GAME_COLUMNS, limit)
+    if rows is None:
+        return jsonify({'error': f'Game {game_id} not found'}), 404
+    return jsonify(row_dicts(rows, SIMILAR_GAME_KEYS))
 
 
 @bp.route('/api/game_recommendations/<game_id>', methods=['GET'])
 def get_game_recommendations(game_id):
-    try:
-        response = requests.get(f'https://store.steampowered.com/appreviewhistogram/{game_id}')
+    """
+    Steam review histogram of a game, served from the local store.
+
+    Steam is asked only when the game has never been fetched; stored histograms
+    older than REVIEW_HISTOGRAM_MAX_AGE are still served and queued for the
+    prefetcher. Last-Modified and Age tell when the data was fetched. In
+    memory mode there is no store and only the upstream client's cache applies.
+    Ids that are not in the dataset are never sent to Steam, so neither store
+    grows past one histogram per game.
+    """
+    backend = get_backend()
+    if not backend.has_game(game_id):
+        return jsonify({'error': f'Game {game_id} not found'}), 404
+
+    use_store = backend.stores_histograms
+    stored = None
+    if use_store:
+        try:
+            stored = load_histogram(game_id)
+        except SQLAlchemyError:
+            db.session.rollback()
 
-        response.raise_for_status()
-        data = response.json()
-        return jsonify(data)
+    try:
+        if stored is not None:
+            histogram, fetched_at = stored
+            if histogram_prefetcher.is_stale(fetched_at):
+                histogram_prefetcher.request_refresh(game_id)
+        else:
+            histogram = review_histograms.get(game_id)
+            fetched_at = utcnow()
+            if use_store:
+                try:
+                    fetched_at = save_histogram(game_id, histogram)
+                except SQLAlchemyError:
+                    db.session.rollback()
     except requests.RequestException as e:
         return jsonify({'error': str(e)}), 500
 
+    response = jsonify(histogram)
+    response.last_modified = fetched_at.replace(tzinfo=timezone.utc)
+    response.age = int((utcnow() - fetched_at).total_seconds())
+    return response
+
 
 @bp.route('/api/game_timeline', methods=['GET'])
+@cached_response
 def get_game_timeline():
-    games = Game.query.all()
-
-    # TODO: Change this to the actual timeline needed for the frontend
-    games_list = []
-    for game in games:
-        games_list.append({
-            'game_id': game.game_id,
-            'name': game.name,
-            'price': game.price,
-            'peak_ccu': game.peak_ccu,
-            'release_date': game.release_date,
-        })
-
-    return jsonify(games_list)
+    """
+    Releases per `bucket=year|month`, optionally split by `group_by=genre|owners`.
+
+    Every bin carries the release count, mean and median price and peak_ccu
+    quantiles. Owners series are grouped by owners_low. The scatter-plot
+    filters (see queries.scatter_filters) apply.
+    """
+    bucket = choice_arg(request.args, 'bucket', BUCKETS, 'year')
+    group_by = choice_arg(request.args, 'group_by', GROUPS, 'none')
+    columns = get_backend().timeline_columns(bucket, group_by, request.args)
+    return jsonify({'bucket': bucket, 'group_by': group_by, 'series': timeline_series(bucket, *columns)})
+
+
+@bp.route('/api/scatter_lod', methods=['GET'])
+@cached_response
+def get_scatter_lod():
+    """
+    Level-of-detail sample of the scatter plot for one viewport.
+
+    `x_min`/`x_max` (price) and `y_min`/`y_max` (peak_ccu) bound the viewport,
+    `scale` is linear or symlog and `width`/`height` its size in pixels. Grid
+    cells of about `cell` pixels holding more than `threshold` games are
+    returned as weighted bins, the rest as individual points.
+    """
+    scale = choice_arg(request.args, 'scale', SCALES, 'symlog')
+    viewport = tuple(number_arg(request.args, name) for name in ('x_min', 'x_max', 'y_min', 'y_max'))
+    width, height, cell, threshold = (
+        default if value is None else value
+        for value, default in (
+            (number_arg(request.args, name, int), default)
+            for name, default in (('width', 1300), ('height', 600), ('cell', 4), ('threshold', 1))
+        )
+    )
+    if not (0 < width <= 10000 and 0 < height <= 10000 and 0 < cell <= 256 and threshold >= 0):
+        raise InvalidParameter("'width' and 'height' must be 1-10000, 'cell' 1-256 and 'threshold' not negative")
+    return jsonify(lod_index.get().sample(scale, viewport, width, height, cell, threshold))
+
+
+@bp.route('/api/games_in_range', methods=['GET'])
+@cached_response
+def get_games_in_range():
+    """
+    Games inside a brush rectangle, answered from the in-memory k-d tree.
+
+    `price_min`/`price_max` and `peak_ccu_min`/`peak_ccu_max` bound the
+    rectangle and `year_min`/`year_max` the release year, all inclusive and
+    optional. `fields=ids` returns only the game ids.
+    """
+    fields = choice_arg(request.args, 'fields', ('rows', 'ids'), 'rows')
+    bounds = {
+        name: number_arg(request.args, name, int if name.startswith('year') else float)
+        for name in ('price_min', 'price_max', 'peak_ccu_min', 'peak_ccu_max', 'year_min', 'year_max')
+    }
+    rows = spatial_index.get().search(**bounds)
+    if fields == 'ids':
+        return jsonify([row.game_id for row in rows])
+    return jsonify(row_dicts(rows, ROW_KEYS))
+
+
+@bp.route('/api/games_filter', methods=['GET'])
+@cached_response
+def get_filtered_games():
+    """
+    Games matching a category / genre / tag expression such as
+    `where=genre:Action AND NOT tag:"Early Access"`, combined with the
+    `year_*`, `price_*`, `peak_ccu_*` and `owners` filters, evaluated on the
+    in-memory bitmap index. `fields=ids` returns only the game ids; the match
+    count is sent as X-Total-Count.
+    """
+    fields = choice_arg(request.args, 'fields', ('rows', 'ids'), 'rows')
+    index = bitmap_index.get()
+    ordinals = index.evaluate(request.args.get('where', ''), request.args).tolist()
+    if fields == 'ids':
+        response = jsonify([index.rows[ordinal][0] for ordinal in ordinals])
+    else:
+        response = jsonify(row_dicts((index.rows[ordinal] for ordinal in ordinals), ROW_KEYS))
+    response.headers['X-Total-Count'] = str(len(ordinals))
+    return response
+
+
+@bp.route('/api/search', methods=['GET'])
+def search_games():
+    """
+    Games whose name or short description contains every word of `q`, best
+    peak_ccu first. Unless `q` ends with a space its last word also matches
+    as a prefix of a name word, for type-ahead.
+    """
+    limit = number_arg(request.args, 'limit', int)
+    limit = 10 if limit is None else limit
+    if not 1 <= limit <= MAX_SEARCH_RESULTS:
+        raise InvalidParameter(f"'limit' must be between 1 and {MAX_SEARCH_RESULTS}")
+    rows = search_index.get().search(request.args.get('q', ''), limit)
+    return jsonify(row_dicts(rows, SEARCH_RESULT_KEYS))
+
+
+@bp.route('/api/facets', methods=['GET'])
+@cached_response
+def get_facets():
+    """
+    Game count and mean peak_ccu per genre and per category, for the bar plots.
+
+    Served from the facet_aggregates table the loader rebuilds, filtered by the
+    scatter plot's `year_*`, `price_*` and `owners` parameters; prices are
+    matched by price band, so a price range counts every band it overlaps.
+    `facet=genre` or `facet=category` limits the response to one of them.
+    """
+    requested = choice_arg(request.args, 'facet', ('all', 'genre', 'category'), 'all')
+    facet_keys = {'genre': 'genres', 'category': 'categories'}
+    wanted = [facet for facet in facet_keys if requested in ('all', facet)]
+
+    facets = {}
+    for facet, rows in get_backend().facet_totals(wanted, request.args).items():
+        items = [
+            {'name': name, 'count': int(count), 'avg_peak_ccu': float(ccu_sum) / ccu_count if ccu_count else None}
+            for name, count, ccu_sum, ccu_count in rows
+        ]
+        items.sort(key=lambda item: (-item['count'], -(item['avg_peak_ccu'] or 0), item['name']))
+        facets[facet_keys[facet]] = items
+    return jsonify(facets)
+
+
+@bp.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(dict(response_cache.stats(), review_histograms=review_histograms.stats(),
+                        histogram_prefetch=histogram_prefetcher.stats()))
+
+
+@bp.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """
+    Start a new dataset version after an out-of-band data fix, so every
+    server process drops its cached responses and indexes and clients'
+    ETags stop matching. Needs `Authorization: Bearer <CACHE_INVALIDATE_TOKEN>`
+    and is disabled while that setting is empty.
+    """
+    token = current_app.config['CACHE_INVALIDATE_TOKEN']
+    supplied = request.headers.get('Authorization', '')
+    if not token or not hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+        return jsonify({'error': 'Forbidden'}), 403
+    if not get_backend().new_version():
+        return jsonify({'error': 'In memory mode the dataset version changes with the snapshot only'}), 409
+    response_cache.clear()
+    return jsonify({'status': 'invalidated', 'version': current_version()})
 
 
 # Register blueprint
@@ -0,0 +1,140 @@
+"""
+In-process search over game names and short descriptions.
+
+Games are numbered by descending peak_ccu, so every posting list is sorted
+best-first and a query can stop as soon as it has `limit` hits. Every word of
+a query must match a word of the name or short description; while the user is
+still typing, the last word also matches any name word it is a prefix of. The
+name vocabulary is kept sorted so a prefix is a bisect range, and the top hits
+for every one- and two-letter prefix are precomputed.
+"""
+import heapq
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+
+import numpy as np
+from sqlalchemy import select
+
+from . import db
+from .columnstore import memory_dataset
+from .dataset import VersionedIndex
+from .models import Game
+
+SHORT_PREFIX = 2
+MAX_RESULTS = 100
+
+RESULT_COLUMNS = (Game.game_id, Game.name, Game.peak_ccu, Game.header_image)
+RESULT_KEYS = [column.key for column in RESULT_COLUMNS]
+
+WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    if not text:
+        return []
+    text = text.casefold()
+    if not text.isascii():
+        # Fold accents so "pokemon" finds "Pokémon"
+        text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return WORD.findall(text)
+
+
+def contains(postings, doc):
+    index = bisect_left(postings, doc)
+    return index < len(postings) and postings[index] == doc
+
+
+def unique(docs):
+    previous = None
+    for doc in docs:
+        if doc != previous:
+            yield doc
+            previous = doc
+
+
+def to_arrays(postings):
+    return {token: array('i', docs) for token, docs in postings.items()}
+
+
+class SearchIndex:
+    def __init__(self, rows):
+        self.rows = []
+        name_postings = defaultdict(list)
+        word_postings = defaultdict(list)
+        self.name_tokens = []
+        # Rows arrive best-first, so appending keeps every posting list sorted
+        for doc, row in enumerate(rows):
+            *result, name, short_description = row
+            self.rows.append(tuple(result))
+            name_tokens = tuple(dict.fromkeys(tokenize(name)))
+            self.name_tokens.append(name_tokens)
+            for token in name_tokens:
+                name_postings[token].append(doc)
+            for token in dict.fromkeys(name_tokens + tuple(tokenize(short_description))):
+                word_postings[token].append(doc)
+
+        self.name_postings = to_arrays(name_postings)
+        self.word_postings = to_arrays(word_postings)
+        self.vocabulary = sorted(self.name_postings)
+
+        short = defaultdict(list)
+        for token in self.vocabulary:
+            for length in range(1, SHORT_PREFIX + 1):
+                if len(token) >= length:
+                    short[token[:length]].append(self.name_postings[token])
+        self.short_prefixes = {
+            prefix: array('i', islice(unique(heapq.merge(*lists)), MAX_RESULTS)) for prefix, lists in short.items()
+        }
+
+    def prefix_postings(self, prefix):
+        """Posting lists of every name word starting with `prefix`"""
+        if len(prefix) <= SHORT_PREFIX:
+            return [self.short_prefixes.get(prefix, ())]
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + '\U0010ffff')
+        return [self.name_postings[token] for token in self.vocabulary[start:end]]
+
+    def matches_partial(self, doc, word):
+        return any(token.startswith(word) for token in self.name_tokens[doc]) \
+            or contains(self.word_postings.get(word, ()), doc)
+
+    def search(self, query, limit=10):
+        words = tokenize(query)
+        if not words:
+            return []
+        partial = None if query[-1:].isspace() else words.pop()
+
+        if words:
+            postings = [self.word_postings.get(word, ()) for word in dict.fromkeys(words)]
+            postings.sort(key=len)
+            docs = (
+                doc for doc in postings[0]
+                if all(contains(other, doc) for other in postings[1:])
+                and (partial is None or self.matches_partial(doc, partial))
+            )
+        else:
+            lists = self.prefix_postings(partial) + [self.word_postings.get(partial, ())]
+            docs = unique(heapq.merge(*lists))
+
+        return [self.rows[doc] for doc in islice(docs, limit)]
+
+
+def build_search_index():
+    store = memory_dataset.get()
+    if store is not None:
+        ordinals = np.arange(store.count)
+        # NaN sorts last, like NULLs under ORDER BY ... DESC in MariaDB
+        ordinals = ordinals[np.lexsort((ordinals, -store.values('peak_ccu')))]
+        return SearchIndex(store.rows(RESULT_KEYS + ['name', 'short_description'], ordinals))
+    query = (
+        select(*RESULT_COLUMNS, Game.name, Game.short_description)
+        .order_by(Game.peak_ccu.desc(), Game.id)
+    )
+    return SearchIndex(db.session.execute(query).all())
+
+
+search_index = VersionedIndex(build_search_index)
@@ -0,0 +1,125 @@
+"""
+k-d tree over (price, peak_ccu) for brush-rectangle queries.
+
+The tree is stored as flat arrays: the points are permuted so every node
+covers a contiguous slice, and each node keeps its bounding box and the range
+of release years below it. A query skips nodes outside the rectangle or the
+year range, takes nodes lying entirely inside as whole slices and only tests
+points one by one in the leaves it partly overlaps, so it costs
+O(log n + output) for typical brushes.
+"""
+import numpy as np
+from sqlalchemy import select
+
+from . import db
+from .columnstore import memory_dataset
+from .dataset import VersionedIndex
+from .models import Game
+
+LEAF_SIZE = 64
+NO_YEAR = -1  # release_year stand-in for games without a release date
+
+ROW_COLUMNS = (
+    Game.game_id, Game.name, Game.release_date, Game.price, Game.header_image, Game.peak_ccu,
+    Game.estimated_owners, Game.release_year,
+)
+ROW_KEYS = [column.key for column in ROW_COLUMNS]
+
+
+class KdTree:
+    def __init__(self, x, y, year, leaf_size=LEAF_SIZE):
+        order = np.arange(len(x))
+        starts, ends, lefts, rights = [], [], [], []
+
+        def add_node(start, end):
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            return len(starts) - 1
+
+        stack = [(add_node(0, len(x)), 0)] if len(x) else []
+        while stack:
+            node, depth = stack.pop()
+            start, end = starts[node], ends[node]
+            if end - start <= leaf_size:
+                continue
+            coordinate = x if depth % 2 == 0 else y
+            middle = (start + end) // 2
+            part = order[start:end]
+            order[start:end] = part[np.argpartition(coordinate[part], middle - start)]
+            lefts[node] = add_node(start, middle)
+            rights[node] = add_node(middle, end)
+            stack.append((lefts[node], depth + 1))
+            stack.append((rights[node], depth + 1))
+
+        self.order = order
+        self.x, self.y, self.year = x[order], y[order], year[order]
+        self.start = np.array(starts, dtype=np.int64)
+        self.end = np.array(ends, dtype=np.int64)
+        self.left = np.array(lefts, dtype=np.int64)
+        self.right = np.array(rights, dtype=np.int64)
+
+        bounds = [[], [], [], [], [], []]
+        for start, end in zip(starts, ends):
+            for values, (low, high) in ((self.x, bounds[0:2]), (self.y, bounds[2:4]), (self.year, bounds[4:6])):
+                low.append(values[start:end].min())
+                high.append(values[start:end].max())
+        self.x_min, self.x_max, self.y_min, self.y_max, self.year_min, self.year_max = map(np.array, bounds)
+
+    def query(self, x_min, x_max, y_min, y_max, year_min, year_max):
+        """Positions (into the original arrays) of the points inside the closed box"""
+        found = []
+        stack = [0] if len(self.start) else []
+        while stack:
+            node = stack.pop()
+            if (self.x_max[node] < x_min or self.x_min[node] > x_max or self.y_max[node] < y_min
+                    or self.y_min[node] > y_max or self.year_max[node] < year_min or self.year_min[node] > year_max):
+                continue
+            start, end = self.start[node], self.end[node]
+            if (x_min <= self.x_min[node] and self.x_max[node] <= x_max and y_min <= self.y_min[node]
+                    and self.y_max[node] <= y_max and year_min <= self.year_min[node]
+                    and self.year_max[node] <= year_max):
+                found.append(self.order[start:end])
+            elif self.left[node] < 0:
+                x, y, year = self.x[start:end], self.y[start:end], self.year[start:end]
+                inside = ((x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+                          & (year >= year_min) & (year <= year_max))
+                found.append(self.order[start:end][inside])
+            else:
+                stack.append(self.right[node])
+                stack.append(self.left[node])
+        return np.sort(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+
+class SpatialIndex:
+    def __init__(self, rows):
+        self.rows = rows
+        self.tree = KdTree(
+            np.array([row.price for row in rows], dtype=np.float64),
+            np.array([row.peak_ccu for row in rows], dtype=np.float64),
+            np.array([NO_YEAR if row.release_year is None else row.release_year for row in rows], dtype=np.int64),
+        )
+
+    def search(self, price_min=None, price_max=None, peak_ccu_min=None, peak_ccu_max=None,
+               year_min=None, year_max=None):
+        """Rows inside the rectangle and year range; None leaves a side open"""
+        if year_min is None and year_max is not None:
+            year_min = 0  # an upper bound alone still excludes games without a year
+        found = self.tree.query(
+            -np.inf if price_min is None else price_min, np.inf if price_max is None else price_max,
+            -np.inf if peak_ccu_min is None else peak_ccu_min, np.inf if peak_ccu_max is None else peak_ccu_max,
+            NO_YEAR if year_min is None else year_min, np.inf if year_max is None else year_max,
+        )
+        return [self.rows[index] for index in found.tolist()]
+
+
+def build_spatial_index():
+    store = memory_dataset.get()
+    if store is not None:
+        return SpatialIndex(store.rows(ROW_KEYS, store.present('price', 'peak_ccu')))
+    query = select(*ROW_COLUMNS).where(Game.price.is_not(None), Game.peak_ccu.is_not(None))
+    return SpatialIndex(db.session.execute(query).all())
+
+
+spatial_index = VersionedIndex(build_spatial_index)
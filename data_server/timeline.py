@@ -0,0 +1,172 @@
+"""
+Release time series for /api/game_timeline.
+
+Games are binned by release year or month, optionally per genre or owners
+bucket, and each bin is summarized as a release count plus price and peak_ccu
+statistics, so the response grows with the number of bins rather than games.
+The statistics are vectorised with NumPy over histograms of the prices and
+peak_ccus per bin: the database counts the games per distinct value in SQL, so
+it sends a row per value rather than per game, and memory mode counts every
+game once.
+"""
+import numpy as np
+from sqlalchemy import extract, func, select
+
+from .models import Game, Genre, game_genre
+
+BUCKETS = ('year', 'month')
+GROUPS = ('none', 'genre', 'owners')
+
+PEAK_CCU_QUANTILES = (('p25', 0.25), ('median', 0.5), ('p75', 0.75), ('p90', 0.9))
+
+
+def timeline_query(bucket, group_by, conditions, value):
+    """
+    Rows of (bucket, *group columns, value, games): the number of matching
+    games with each distinct `value`, NULL included, per bin. The bucket is the
+    release year, or the release month counted from year 0; the group columns
+    are the genre name or the owners bounds.
+    """
+    if bucket == 'year':
+        when = Game.release_year
+    else:
+        when = extract('year', Game.release_date) * 12 + extract('month', Game.release_date) - 1
+    group_columns = {'genre': (Genre.name,), 'owners': (Game.owners_low, Game.owners_high)}.get(group_by, ())
+    query = select(when, *group_columns, value, func.count()).select_from(Game)
+    if group_by == 'genre':
+        query = query.join(game_genre, game_genre.c.game_id == Game.id).join(Genre, Genre.id == game_genre.c.genre_id)
+    release = Game.release_year if bucket == 'year' else Game.release_date
+    return query.where(release.is_not(None), *conditions).group_by(when, *group_columns, value)
+
+
+def timeline_columns(price_rows, peak_ccu_rows, group_by):
+    """
+    The rows of the price and peak_ccu timeline_query as what timeline_series
+    takes: the group names and one (bucket, group code, value, games) array
+    histogram per column.
+    """
+    width = {'none': 0, 'genre': 1, 'owners': 2}[group_by]
+    tables = [list(zip(*rows)) or [()] * (width + 3) for rows in (price_rows, peak_ccu_rows)]
+    # Coded together, so both histograms number the groups alike
+    group_values = [price + peak_ccu for price, peak_ccu in zip(tables[0][1:width + 1], tables[1][1:width + 1])]
+    split = len(tables[0][0])
+    groups, names = group_codes(group_by, split + len(tables[1][0]), *group_values)
+    histograms = [
+        (
+            np.array(columns[0], dtype=np.int64),
+            codes,
+            # None becomes NaN
+            np.array(columns[-2], dtype=np.float64),
+            np.array(columns[-1], dtype=np.int64),
+        )
+        for columns, codes in zip(tables, (groups[:split], groups[split:]))
+    ]
+    return names, *histograms
+
+
+def group_codes(group_by, count, *values):
+    """
+    Codes of each of `count` rows' group and the group names they index, in
+    series order. Genres are named and ordered by name; owners buckets are
+    grouped by their lower bound and named by their range as the `owners`
+    filter takes it. Games without a group come last, as the group None.
+    """
+    if group_by == 'genre':
+        (genres,) = values
+        names, codes = np.unique(np.array(genres, dtype=object), return_inverse=True)
+        return codes, names.tolist()
+    if group_by == 'owners':
+        low, high = (np.array(bounds, dtype=np.float64) for bounds in values)
+        # NaN sorts last, and equal_nan makes it a single group
+        lows, codes = np.unique(low, return_inverse=True)
+        highs = np.full(len(lows), np.nan)
+        np.fmax.at(highs, codes, high)
+        names = [
+            None if low != low else f'{int(low)}-{int(high)}' for low, high in zip(lows.tolist(), highs.tolist())
+        ]
+        return codes, names
+    return np.zeros(count, dtype=np.int64), [None]
+
+
+def bin_quantiles(bins, values, weights, size, quantiles):
+    """
+    Linearly interpolated quantiles of the non-NaN `values` of each of `size`
+    bins, each value counted `weights` times, as one array per quantile with
+    NaN for bins without values.
+    """
+    known = ~np.isnan(values)
+    bins, values, weights = bins[known], values[known], weights[known]
+    counts = np.bincount(bins, weights=weights, minlength=size).astype(np.int64)
+    if not len(values):
+        return [np.full(size, np.nan) for _ in quantiles]
+    order = np.lexsort((values, bins))
+    values = values[order]
+    # The game at position i of the sorted bins has the first value whose running count exceeds i
+    ends = np.cumsum(weights[order])
+    starts = np.cumsum(counts) - counts
+    last = np.maximum(counts - 1, 0)
+
+    def value_at(positions):
+        return values[np.minimum(np.searchsorted(ends, starts + positions, side='right'), len(values) - 1)]
+
+    result = []
+    for q in quantiles:
+        position = last * q
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, last)
+        low_values = value_at(low)
+        high_values = value_at(high)
+        result.append(np.where(counts > 0, low_values + (high_values - low_values) * (position - low), np.nan))
+    return result
+
+
+def nullable(values):
+    return [None if value != value else value for value in values.tolist()]
+
+
+def timeline_series(bucket, names, prices, peak_ccus):
+    """
+    One series per group, each a list of summarized bins in time order, from
+    the (bucket, group code, value, games) histograms of the prices and the
+    peak_ccus of the same games; either one counts the releases.
+    """
+    when = np.concatenate([prices[0], peak_ccus[0]])
+    offset = int(when.min()) if len(when) else 0
+    span = int(when.max()) - offset + 1 if len(when) else 1
+    keys = np.unique(np.concatenate([prices[1], peak_ccus[1]]) * span + (when - offset))
+    size = len(keys)
+    price_bins, peak_ccu_bins = (
+        np.searchsorted(keys, groups * span + (when - offset)) for when, groups, _, _ in (prices, peak_ccus)
+    )
+    _, _, price_values, price_games = prices
+    _, _, peak_ccu_values, peak_ccu_games = peak_ccus
+
+    counts = np.bincount(price_bins, weights=price_games, minlength=size).astype(np.int64)
+    known = ~np.isnan(price_values)
+    price_counts = np.bincount(price_bins[known], weights=price_games[known], minlength=size)
+    price_sums = np.bincount(price_bins[known], weights=price_values[known] * price_games[known], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        price_means = np.where(price_counts > 0, price_sums / price_counts, np.nan)
+    (price_medians,) = bin_quantiles(price_bins, price_values, price_games, size, (0.5,))
+    peak_ccu_quantiles = bin_quantiles(
+        peak_ccu_bins, peak_ccu_values, peak_ccu_games, size, [q for _, q in PEAK_CCU_QUANTILES],
+    )
+
+    columns = [counts.tolist(), nullable(price_means), nullable(price_medians)]
+    columns += [nullable(values) for values in peak_ccu_quantiles]
+    series = {}
+    for key, count, price_mean, price_median, *quantiles in zip(keys.tolist(), *columns):
+        group, when = divmod(key, span)
+        when += offset
+        point = {
+            'bucket': when if bucket == 'year' else f'{when // 12:04d}-{when % 12 + 1:02d}',
+            'count': count,
+            'price_mean': price_mean,
+            'price_median': price_median,
+        }
+        for (name, _), value in zip(PEAK_CCU_QUANTILES, quantiles):
+            point[f'peak_ccu_{name}'] = value
+        series.setdefault(group, []).append(point)
+
+    # Keys sort by group code, then time
+    return [{'group': names[group], 'points': points} for group, points in series.items()]
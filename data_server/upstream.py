@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+
+class _Fetch:
+    """An upstream request in flight, shared by every caller asking for the same key"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ReviewHistogramClient:
+    """
+    Client for the Steam store review histograms behind /api/game_recommendations.
+
+    Requests go through one keep-alive session with a bounded connection pool
+    and (connect, read) timeouts. Responses are cached for
+    RECOMMENDATIONS_CACHE_TTL seconds; concurrent misses for the same game share
+    a single upstream request. For RECOMMENDATIONS_STALE_TTL seconds after
+    expiry a cached histogram is still served while a background request
+    refreshes it (0 disables this). Refreshes run on a pool of
+    UPSTREAM_REFRESH_WORKERS threads and each game is queued at most once.
+    """
+
+    def __init__(self):
+        self.base_url = 'https://store.steampowered.com'
+        self.timeout = (3.05, 10)
+        self.ttl = 3600
+        self.stale_ttl = 0
+        self.session = None
+        self.cache = TTLCache()
+        self.in_flight = {}
+        self.refreshing = set()
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.base_url = config['STEAM_STORE_BASE_URL'].rstrip('/')
+        self.timeout = (config['UPSTREAM_CONNECT_TIMEOUT'], config['UPSTREAM_READ_TIMEOUT'])
+        self.ttl = config['RECOMMENDATIONS_CACHE_TTL']
+        self.stale_ttl = config['RECOMMENDATIONS_STALE_TTL']
+        self.cache.configure(config['RECOMMENDATIONS_CACHE_SIZE'], self.ttl + self.stale_ttl)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config['UPSTREAM_POOL_SIZE'], pool_block=True)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(config['UPSTREAM_REFRESH_WORKERS'], thread_name_prefix='histogram-refresh')
+        app.extensions['review_histograms'] = self
+
+    def fetch(self, game_id):
+        response = self.session.get(f'{self.base_url}/appreviewhistogram/{game_id}', timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _fetch_once(self, game_id):
+        """Fetch and cache a histogram, joining a request already in flight for `game_id`"""
+        with self.lock:
+            fetch = self.in_flight.get(game_id)
+            leader = fetch is None
+            if leader:
+                fetch = self.in_flight[game_id] = _Fetch()
+
+        if leader:
+            try:
+                fetch.result = self.fetch(game_id)
+                self.cache.put(game_id, (time.monotonic(), fetch.result))
+            except Exception as error:
+                fetch.error = error
+            finally:
+                with self.lock:
+                    del self.in_flight[game_id]
+                fetch.done.set()
+        else:
+            fetch.done.wait()
+
+        if fetch.error is not None:
+            raise fetch.error
+        return fetch.result
+
+    def _refresh(self, game_id):
+        with self.lock:
+            if game_id in self.in_flight or game_id in self.refreshing:
+                return
+            self.refreshing.add(game_id)
+
+        def refresh():
+            try:
+                self._fetch_once(game_id)
+            except requests.RequestException as error:
+                log.warning("Refreshing review histogram for %s failed: %s", game_id, error)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(game_id)
+
+        self.executor.submit(refresh)
+
+    def get(self, game_id):
+        cached = self.cache.get(game_id)
+        if cached is not None:
+            fetched_at, histogram = cached
+            if time.monotonic() - fetched_at > self.ttl:
+                self._refresh(game_id)
+            return histogram
+        return self._fetch_once(game_id)
+
+    def stats(self):
+        with self.lock:
+            in_flight = len(self.in_flight)
+            refreshing = len(self.refreshing)
+        return dict(self.cache.stats(), in_flight=in_flight, refreshing=refreshing, ttl=self.ttl,
+                    stale_ttl=self.stale_ttl)
+
+
+review_histograms = ReviewHistogramClient()
@@ -0,0 +1,82 @@
+"""
+Production server settings, picked up by running `gunicorn` in the project root.
+
+The app and its dataset are loaded once in the master process (preload_app)
+and the in-memory indexes are built there before the workers are forked, so
+every worker starts warm and shares those pages copy-on-write instead of
+building its own copy. `kill -HUP <master pid>` reloads gracefully: the master
+loads the current dataset again, forks new workers from it and lets the old
+ones finish their requests. In memory mode the master does that by itself when
+a new snapshot appears. Any setting can be overridden on the command line,
+e.g. `gunicorn --workers 8 --threads 2`.
+"""
+import gc
+import os
+import signal
+import threading
+import time
+
+from data_server import db
+from data_server.dataset import reload_dataset, warm_up
+
+wsgi_app = 'run:app'
+bind = os.environ.get('BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 4))
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def freeze():
+    # Objects the garbage collector never visits keep their pages shared after the fork
+    gc.collect()
+    gc.freeze()
+
+
+def snapshot_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def watch_snapshot(server, path, interval):
+    """Reload the workers (as SIGHUP does) whenever the snapshot file is replaced"""
+    seen = snapshot_signature(path)
+    while True:
+        time.sleep(interval)
+        current = snapshot_signature(path)
+        if current is not None and current != seen:
+            seen = current
+            server.log.info("New dataset snapshot %s, reloading workers", path)
+            os.kill(os.getpid(), signal.SIGHUP)
+
+
+def when_ready(server):
+    app = server.app.wsgi()
+    warm_up(app)
+    freeze()
+    config = app.config
+    if config['DATA_SOURCE'] == 'memory' and config['DATA_SNAPSHOT_PATH'] and config['DATA_RELOAD_CHECK_SECONDS']:
+        threading.Thread(
+            target=watch_snapshot, args=(server, config['DATA_SNAPSHOT_PATH'], config['DATA_RELOAD_CHECK_SECONDS']),
+            name='snapshot-watch', daemon=True,
+        ).start()
+
+
+def on_reload(server):
+    gc.unfreeze()
+    reload_dataset(server.app.wsgi())
+    freeze()
+
+
+def post_fork(server, worker):
+    # Every worker opens its own pool; never reuse a connection of the master
+    with server.app.wsgi().app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -8,6 +8,7 @@ import json
 import csv
 import ast
 import os
+import sys
 from collections import defaultdict
 from pathlib import Path
 
@@ -415,9 +416,28 @@ def split_into_chunks(data, num_chunks, output_dir):
     
     print(f"\nAll {num_chunks} chunks written to: {output_dir}")
 
+def write_server_snapshot(data_dir):
+    """Write the binary snapshot the data server maps in memory mode from the new chunks"""
+    print("\nWriting server snapshot...")
+
+    sys.path.insert(0, str(PROJECT_ROOT))
+    try:
+        from config import Config
+        from data_server.columnstore import load_chunks
+        from data_server.snapshot import write_snapshot
+    except ImportError as e:
+        print(f"  Skipped, the server dependencies are not installed ({e})")
+        print("  Run `python -m data_server.snapshot` once they are")
+        return
+
+    snapshot_file = PROJECT_ROOT / Config.DATA_SNAPSHOT_PATH
+    store = load_chunks(data_dir)
+    write_snapshot(store, snapshot_file)
+
+    file_size_mb = snapshot_file.stat().st_size / (1024 * 1024)
+    print(f"  [OK] {snapshot_file.name}: {store.count} games ({file_size_mb:.2f} MB)")
+
 def main():
-    import sys
-    
     print("Steam Data Analysis and Merge Tool")
     print("=" * 80)
     
@@ -457,6 +477,7 @@ def main():
             
             # Split into chunks
             split_into_chunks(merged_data, NUM_CHUNKS, OLD_DATA_DIR)
+            write_server_snapshot(OLD_DATA_DIR)
             
             print("\n" + "=" * 80)
             print("MERGE COMPLETE!")